@@ -0,0 +1,112 @@
+import threading
+
+
+class RWLock(object):
+    """
+    Readers-writer lock: many threads may hold it for reading at once, a
+    single one for writing (then excluding the readers)
+
+    Waiting writers take precedence over new readers, so they are not
+    starved by a stream of searches. Both locks are reentrant in a given
+    thread, and the writer may take the read lock too (the other way
+    around, taking the write lock while reading, would deadlock).
+
+    Use it through the 'read()' and 'write()' context managers:
+
+        with lock.read():
+            ...
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writes = 0
+        self._waiting = 0
+        self._local = threading.local()
+        self._read = _Hold(self.acquire_read, self.release_read)
+        self._write = _Hold(self.acquire_write, self.release_write)
+
+    def read(self):
+        return self._read
+
+    def write(self):
+        return self._write
+
+    def acquire_read(self):
+        me = threading.current_thread()
+        reads = getattr(self._local, 'reads', 0)
+        with self._cond:
+            if not reads and self._writer is not me:
+                while self._writer is not None or self._waiting:
+                    self._cond.wait()
+            self._readers += 1
+        self._local.reads = reads + 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            self._local.reads -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.current_thread()
+        with self._cond:
+            if self._writer is not me:
+                self._waiting += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._waiting -= 1
+                self._writer = me
+            self._writes += 1
+
+    def release_write(self):
+        with self._cond:
+            self._writes -= 1
+            if not self._writes:
+                self._writer = None
+                self._cond.notify_all()
+
+
+class NoLock(object):
+    """
+    Stand-in for 'RWLock' (same interface) that does no locking at all
+    """
+    def read(self):
+        return _NO_HOLD
+
+    def write(self):
+        return _NO_HOLD
+
+
+class ReadOnly(NoLock):
+    """
+    As 'NoLock', for read-only trees: taking the write lock raises an error
+    """
+    def write(self):
+        raise ValueError("Error: read-only tree (snapshot) can't be modified")
+
+
+class _Hold(object):
+    # context manager calling 'acquire' on entry, 'release' on exit
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self):
+        self._acquire()
+
+    def __exit__(self, *exc):
+        self._release()
+        return False
+
+
+class _NoHold(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_HOLD = _NoHold()
@@ -1,13 +1,41 @@
+from collections import namedtuple
+
 import numpy as np
 INF = np.iinfo(np.int64).max
 
 
+class Node(object):
+    """
+    Tree node; its 'bbox' (list) is updated in place as the tree changes
+
+    'boxes' caches the children bboxes as a (n,4) array, None when stale.
+    A 'frozen' node is shared with a snapshot: it is never modified again,
+    but copied (see 'rbush.node.thaw')
+    """
+    __slots__ = ('bbox', 'children', 'leaf', 'height', 'boxes', 'frozen')
+
+    def __init__(self, bbox, children, leaf, height):
+        self.bbox = bbox
+        self.children = children
+        self.leaf = leaf
+        self.height = height
+        self.boxes = None
+        self.frozen = False
+
+
+Item = namedtuple('Item', ['bbox', 'data', 'id'])
+
+
 def create_bbox(xmin, ymin, xmax, ymax):
     return (xmin, ymin, xmax, ymax)
 
 
 def create_node(bbox, leaf=None, height=None, children=None):
-    return (bbox, children, leaf, height)
+    return Node(list(bbox), children, leaf, height)
+
+
+def create_item(bbox, data=None, item_id=None):
+    return Item(bbox, data, item_id)
 
 
 def create_root(children=None, height=1, leaf=True):
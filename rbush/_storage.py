@@ -0,0 +1,221 @@
+"""
+Binary layout of a packed tree in a single (contiguous) buffer, or file
+
+ - 8 bytes  : magic string 'RBUSH001'
+ - 8 bytes  : length of the header (little-endian uint64)
+ - header   : JSON object, with the tree attributes and, under 'arrays',
+              the dtype, shape and offset (from the end of the header) of
+              each array
+ - arrays   : raw arrays contents, each one aligned to 64 bytes
+
+Arrays read back are views into the buffer (no copy).
+"""
+import json
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python < 3.8
+    shared_memory = None
+
+MAGIC = b'RBUSH001'
+ALIGN = 64
+
+_tracker_lock = threading.Lock()
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def layout(attrs, arrays):
+    """
+    Return the prefix (magic, header), the position of the first array and
+    the total size of 'attrs' (JSON serializable dict) and 'arrays' (dict
+    of numpy arrays, None ones left out) laid out, and the arrays specs
+    """
+    specs = {}
+    size = 0
+    for name, arr in arrays.items():
+        if arr is None:
+            continue
+        if arr.dtype.hasobject:
+            msg = "Error: array '{}' of python objects can't be stored"
+            raise ValueError(msg.format(name))
+        size = _aligned(size)
+        specs[name] = dict(dtype=arr.dtype.str, shape=list(arr.shape),
+                           offset=size)
+        size += arr.nbytes
+    header = json.dumps(dict(attrs, arrays=specs)).encode('utf-8')
+    prefix = MAGIC + struct.pack('<Q', len(header)) + header
+    start = _aligned(len(prefix))
+    return prefix, start, start + size, specs
+
+
+def encode(attrs, arrays, allocate=bytearray):
+    """
+    Lay out 'attrs' and 'arrays' (see 'layout') in the buffer returned by
+    'allocate(size)'. Return the buffer
+    """
+    prefix, start, size, specs = layout(attrs, arrays)
+    buffer = allocate(size)
+    view = memoryview(buffer).cast('B')
+    view[:len(prefix)] = prefix
+    for name, spec in specs.items():
+        raw = _raw(arrays[name])
+        first = start + spec['offset']
+        view[first:first + len(raw)] = raw
+    return buffer
+
+
+def _raw(arr):
+    # array contents, as a flat uint8 array
+    return np.ascontiguousarray(arr).view(np.uint8).reshape(-1)
+
+
+def decode(buffer):
+    """
+    Return the attributes dict and the dict of arrays laid out in 'buffer'
+    (see 'encode'); arrays are read-only views into 'buffer'
+    """
+    view = memoryview(buffer).cast('B')
+    if bytes(view[:8]) != MAGIC:
+        raise ValueError("Error: not a packed tree buffer")
+    length, = struct.unpack('<Q', view[8:16])
+    attrs = json.loads(bytes(view[16:16 + length]).decode('utf-8'))
+    start = _aligned(16 + length)
+    arrays = {}
+    for name, spec in attrs.pop('arrays').items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape']))
+        arr = np.frombuffer(view, dtype=dtype, count=count,
+                            offset=start + spec['offset'])
+        arr = arr.reshape(spec['shape'])
+        arr.flags.writeable = False
+        arrays[name] = arr
+    return attrs, arrays
+
+
+def chunks(attrs, arrays):
+    """
+    Yield, one after the other, the (bytes-like) chunks of 'attrs' and
+    'arrays' laid out (see 'layout'), arrays contents not being copied
+    """
+    prefix, start, size, specs = layout(attrs, arrays)
+    yield prefix
+    position = len(prefix)
+    for name, spec in specs.items():
+        first = start + spec['offset']
+        raw = _raw(arrays[name])
+        yield b'\0' * (first - position)
+        yield memoryview(raw)
+        position = first + len(raw)
+    yield b'\0' * (size - position)
+
+
+def dumps(attrs, arrays):
+    """
+    Return the bytes of 'attrs' and 'arrays' laid out (see 'layout')
+    """
+    return b''.join(chunks(attrs, arrays))
+
+
+def save(path, attrs, arrays):
+    """
+    Write 'attrs' and 'arrays' laid out (see 'layout') to file 'path'
+
+    The file is written aside, then moved to 'path': a failed save leaves
+    'path' as it was, and 'arrays' may be views of the file 'path' itself
+    (memory-mapped, see 'load').
+    """
+    # laid out (and checked) before anything is written
+    parts = list(chunks(attrs, arrays))
+    temp = '{}.{}-{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    try:
+        with open(temp, 'wb') as f:
+            for part in parts:
+                f.write(part)
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def load(path, mmap=True):
+    """
+    Return the attributes and arrays (see 'decode') stored in file 'path'
+
+    With 'mmap', arrays are read-only views of the memory-mapped file,
+    their pages read from disk as they are accessed. Otherwise they are
+    read at once, in (writable) memory.
+    """
+    if mmap:
+        return decode(np.memmap(path, dtype=np.uint8, mode='r'))
+    attrs, arrays = decode(np.fromfile(path, dtype=np.uint8))
+    for arr in arrays.values():
+        arr.flags.writeable = True
+    return attrs, arrays
+
+
+def share(attrs, arrays, name=None):
+    """
+    Lay out 'attrs' and 'arrays' (see 'encode') in a new shared memory
+    block (named 'name', if given). Return the SharedMemory object
+    """
+    if shared_memory is None:
+        msg = "Error: shared memory needs python >= 3.8"
+        raise ValueError(msg)
+    blocks = []
+
+    def allocate(size):
+        blocks.append(shared_memory.SharedMemory(name=name, create=True,
+                                                 size=size))
+        return blocks[0].buf
+    try:
+        encode(attrs, arrays, allocate)
+    except Exception:
+        for block in blocks:
+            block.close()
+            block.unlink()
+        raise
+    return blocks[0]
+
+
+def attach(name):
+    """
+    Return the attributes, arrays (see 'decode') and SharedMemory object
+    of the shared memory block 'name' (as made by 'share')
+
+    The block is left to its creator to unlink.
+    """
+    if shared_memory is None:
+        msg = "Error: shared memory needs python >= 3.8"
+        raise ValueError(msg)
+    try:
+        block = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 tracks attached blocks too, unlinking them once the
+        # process ends: skip the tracking
+        with _untracked():
+            block = shared_memory.SharedMemory(name=name)
+    attrs, arrays = decode(block.buf)
+    return attrs, arrays, block
+
+
+@contextmanager
+def _untracked():
+    # have 'SharedMemory' skip registering blocks to the resource tracker
+    from multiprocessing import resource_tracker
+    with _tracker_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            yield
+        finally:
+            resource_tracker.register = register
@@ -12,6 +12,14 @@ def search(tree, data):
     return time.time() - tic
 
 
+def search_many(tree, data, workers=1):
+    queries = [[item['xmin'], item['ymin'], item['xmax'], item['ymax']]
+               for item in data]
+    tic = time.time()
+    tree.search_many(queries, workers=workers)
+    return time.time() - tic
+
+
 def insertion(tree, data):
     tic = time.time()
     for item in data:
@@ -89,6 +97,15 @@ def run(N_insert=None, N_remove=None, _load=None):
     t_search1 = search(tree, bboxes1)
     print('{:d} searches in ~0.01%: {:.5f}'.format(N_search, t_search1))
 
+    # Search items 0.01%, all at once
+    t_search1 = search_many(tree, bboxes1)
+    print('{:d} batch searches in ~0.01%: {:.5f}'.format(N_search, t_search1))
+
+    # Search items 0.01%, all at once, on all cores
+    t_search1 = search_many(tree, bboxes1, workers=-1)
+    print('{:d} batch searches in ~0.01%, all cores: {:.5f}'.format(
+        N_search, t_search1))
+
 
 def usage():
     print(' Usage:\n\t python benchmark.py [n_insert] [n_remove] [load]')
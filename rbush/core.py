@@ -1,56 +1,208 @@
+import threading
+
 from ._utils import RBJSONEncoder as _jsenc
+from ._lock import RWLock, NoLock, ReadOnly
 from .tree import *
+from . import packed
+from . import _storage
 
 MAXENTRIES = 9
 MINENTRIES = int(9*0.4)
+MAXDEAD = 0.5
+# batches of queries pack a modified tree again only once they count more
+# than 1/REPACK of its items: walking the nodes is cheaper for fewer
+REPACK = 128
+
+
+STRATEGIES = ('rbush', 'rstar')
+SPLITS = ('rstar', 'quadratic', 'linear')
 
 
 class RBush(object):
-    def __init__(self, maxentries=None, minentries=None):
+    def __init__(self, maxentries=None, minentries=None, strategy='rbush',
+                 split='rstar', threadsafe=False):
+        # 'strategy' for one-by-one inserts: 'rbush' (least enlargement),
+        # or 'rstar' (R*-tree: least overlap enlargement next to leaves, and
+        # forced reinsertion of overflowing nodes farthest children).
+        # 'split' for overflowing nodes: 'rstar' (sorted along one axis),
+        # or Guttman's 'quadratic' / 'linear' (cheaper, with large nodes).
+        # With 'threadsafe', queries share a readers-writer lock that
+        # modifications take exclusively (see 'rbush._lock.RWLock'). Only
+        # the queries on the packed tree run without the GIL: after a
+        # modification, queries walk the nodes in python until a large
+        # enough batch of 'search_many' or 'knn_many' queries (see REPACK)
+        # packs the tree again (once, for all the threads querying it).
+        if strategy not in STRATEGIES:
+            msg = "Error: unknown strategy '{}', expected one of {}"
+            raise ValueError(msg.format(strategy, STRATEGIES))
+        if split not in SPLITS:
+            msg = "Error: unknown split '{}', expected one of {}"
+            raise ValueError(msg.format(split, SPLITS))
         self.maxentries = maxentries or MAXENTRIES
         self.minentries = minentries or MINENTRIES
+        self.strategy = strategy
+        self.split_method = split
+        self._lock = RWLock() if threadsafe else NoLock()
+        # readers packing the tree at once wait for a single one to do it
+        self._pack_lock = threading.Lock()
         self.clear()
 
     def clear(self):
-        self._root = create_root()
+        # The tree lives either in '_packed' (as set by 'load'), or in the
+        # nested nodes of '_root' as soon as it gets modified ('_packed' is
+        # then kept as a cache of '_root' until the next modification).
+        # Items get sequential ids, as their position in the loaded arrays;
+        # '_index' maps them to their leaf node (None while packed only).
+        # Ids of discarded (or gone) items are flagged in '_dead', '_ndead'
+        # counting the discarded items still stored in the tree.
+        # '_shared' tells whether '_root' nodes may be shared with snapshots
+        # (frozen, see 'snapshot').
+        with self._lock.write():
+            self._root = create_root()
+            self._packed = None
+            self._next_id = 0
+            self._index = {}
+            self._dead = np.zeros(0, dtype=bool)
+            self._ndead = 0
+            self._shared = False
+
+    def _new_ids(self, num_items):
+        ids = np.arange(self._next_id, self._next_id + num_items)
+        self._next_id += num_items
+        return ids
+
+    def _size(self):
+        """
+        Return the number of items stored (discarded ones included)
+        """
+        if self._root is None:
+            return int(self._packed.sizes[0])
+        return len(self._index)
+
+    def _dead_flags(self):
+        """
+        Return the '_dead' array if any stored item is discarded, else None
+        """
+        if self._ndead:
+            return self._dead
+        return None
+
+    def _alive(self, ids):
+        """
+        Return the boolean mask of (not discarded) items in 'ids' array
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        alive = np.ones(len(ids), dtype=bool)
+        if self._ndead:
+            flagged = (ids >= 0) & (ids < len(self._dead))
+            alive[flagged] = ~self._dead[ids[flagged]]
+        return alive
+
+    def _unpack(self):
+        """
+        Return the root node to be modified, unpacking the packed tree (or
+        copying the root shared with a snapshot)
+        """
+        if self._root is None:
+            self._root = unpack(self._packed)
+            self._index = index_leaves(self._root, {})
+            self._shared = False
+        elif self._root.frozen:
+            self._root = thaw(self._root, self._index)
+        self._packed = None
+        return self._root
+
+    def _thaw(self, ids):
+        """
+        Copy the nodes shared with snapshots down to the leaves of 'ids'
+        items, before these get modified in place
+        """
+        if self._shared:
+            leaves = [self._index[item_id] for item_id in ids
+                      if item_id in self._index]
+            thaw_leaves(self._root, leaves, self._index)
+
+    def _batch_tree(self, num_queries):
+        """
+        Return the packed tree to run a batch of 'num_queries' queries on,
+        or None if the (modified) tree is better walked through its nodes
+        """
+        if self._packed is None and num_queries * REPACK <= self._size():
+            return None
+        return self._pack()
+
+    def _pack(self):
+        """
+        Return the packed tree, packing the root node if needed
+        """
+        packed_tree = self._packed
+        if packed_tree is None:
+            with self._pack_lock:
+                if self._packed is None:
+                    self._packed = packed.pack_tree(self._root)
+                packed_tree = self._packed
+        return packed_tree
 
     @property
     def xmin(self):
-        return xminf(self._root)
+        with self._lock.read():
+            if self._root is None:
+                return self._packed.bboxes[0, 0]
+            return xminf(self._root)
 
     @property
     def ymin(self):
-        return yminf(self._root)
+        with self._lock.read():
+            if self._root is None:
+                return self._packed.bboxes[0, 1]
+            return yminf(self._root)
 
     @property
     def xmax(self):
-        return xmaxf(self._root)
+        with self._lock.read():
+            if self._root is None:
+                return self._packed.bboxes[0, 2]
+            return xmaxf(self._root)
 
     @property
     def ymax(self):
-        return ymaxf(self._root)
+        with self._lock.read():
+            if self._root is None:
+                return self._packed.bboxes[0, 3]
+            return ymaxf(self._root)
 
     @property
     def height(self):
-        return heightf(self._root)
+        with self._lock.read():
+            if self._root is None:
+                return int(self._packed.heights[0])
+            return heightf(self._root)
 
     @property
     def empty(self):
-        return len(childrenf(self._root)) == 0
+        with self._lock.read():
+            if self._root is None:
+                return bool(self._packed.sizes[0] == 0)
+            return len(childrenf(self._root)) == 0
 
-    def insert(self, xmin, ymin, xmax, ymax, data=None):
+    def insert(self, xmin, ymin, xmax, ymax, data=None, batch=False):
         """
         Insert element(s)
 
         'xmin,ymin,xmax,ymax' may be arrays either numpy arrays (same size N),
         or scalars (to insert one item)
 
+        With 'batch', the N items are routed together to their leaves, then
+        overflowing nodes are split once each (faster on large arrays than
+        inserting them one by one, though nodes end up less tight).
+
         Input:
          - xmin : scalar or array-like
          - ymin : scalar or array-like
          - xmax : scalar or array-like
          - ymax : scalar or array-like
          - data : None or array-like
+         - batch : bool
 
         Output:
          - self : RBush
@@ -76,12 +228,25 @@ class RBush(object):
             print(msg)
             return self
 
-        root = insert(self._root, xmin, ymin, xmax, ymax, data,
-                      maxentries=self.maxentries, minentries=self.minentries)
-        self._root = root
+        with self._lock.write():
+            root = self._unpack()
+            ids = self._new_ids(len(xmin))
+            if batch:
+                root = insert_batch(root, xmin, ymin, xmax, ymax, data,
+                                    maxentries=self.maxentries,
+                                    minentries=self.minentries,
+                                    ids=ids, index=self._index)
+            else:
+                root = insert(root, xmin, ymin, xmax, ymax, data,
+                              maxentries=self.maxentries,
+                              minentries=self.minentries,
+                              ids=ids, index=self._index,
+                              strategy=self.strategy,
+                              split_method=self.split_method)
+            self._root = root
         return self
 
-    def load(self, arr, data=None):
+    def load(self, arr, data=None, method='omt', workers=1):
         """
         Load 'arr' array into tree
 
@@ -91,13 +256,27 @@ class RBush(object):
 
         If 'data' is given, it is expected to be an array with N elements
 
+        Loading into an empty tree packs it in contiguous arrays (see
+        'rbush.packed'), where leaf items keep their position in 'arr'.
+
+        Items are grouped in nodes either by the 'omt' (Overlap Minimizing
+        Top-down) algorithm, or along a Hilbert curve ('hilbert'), which
+        packs full nodes with a single sort; fast to build and compact, it
+        fits static datasets best.
+
         Input:
-         - arr  : numpy.ndarray of shape (N,4)
-         - data : numpy.ndarray of shape (N,)
+         - arr     : numpy.ndarray of shape (N,4)
+         - data    : numpy.ndarray of shape (N,)
+         - method  : bulk load algorithm, 'omt' or 'hilbert'
+         - workers : number of threads to build the tree with (-1 for all)
 
         Output:
          - self : RBush
         """
+        if method not in packed.METHODS:
+            msg = "Error: unknown bulk load method '{}', expected one of {}"
+            raise ValueError(msg.format(method, packed.METHODS))
+
         if arr is None or len(arr) == 0:
             raise ValueError('Array must be non-zero length')
 
@@ -114,9 +293,23 @@ class RBush(object):
             msg = ("Error: 'arr' shape mismatch, was expecting 4 coluns")
             raise ValueError(msg)
 
-        root = load(self._root, arr,
-                    maxentries=self.maxentries, minentries=self.minentries)
-        self._root = root
+        with self._lock.write():
+            if self.empty and len(arr) >= self.minentries:
+                self._packed = pack(arr, self.maxentries, data,
+                                    ids=self._new_ids(len(arr)),
+                                    method=method, workers=workers)
+                self._root = None
+                self._index = None
+                return self
+
+            root = load(self._unpack(), arr, items_data=data,
+                        ids=self._new_ids(len(arr)), index=self._index,
+                        method=method, workers=workers,
+                        maxentries=self.maxentries,
+                        minentries=self.minentries,
+                        strategy=self.strategy,
+                        split_method=self.split_method)
+            self._root = root
         return self
 
     def load_dataframe(self, df):
@@ -129,31 +322,535 @@ class RBush(object):
 
         return self.load(np.asarray(df))
 
-    def all(self):
+    def all(self, return_indices=False):
         """
-        Return a list of all items (leaves) from RBush
-        """
-        items = retrieve_all_items(self._root)
-        return map(np.asarray, zip(*items))
+        Return all items (leaves) from RBush
 
-    def search(self, xmin, ymin, xmax, ymax):
+        Output is a tuple of arrays '(bboxes, data)', or the array of items
+        ids if 'return_indices' (see 'search').
+        """
+        with self._lock.read():
+            if self._packed is not None:
+                positions = slice(None)
+                if self._ndead:
+                    alive = self._alive(self._packed.items)
+                    positions = np.flatnonzero(alive)
+                return self._packed_items(positions, return_indices)
+            items = retrieve_all_items(self._root)
+            return self._node_items(items, return_indices)
+
+    def search(self, xmin, ymin, xmax, ymax, return_indices=False):
         """
         Return items contained by or intersecting with 'xmin,ymin,xmax,ymax'
+
+        Output is a tuple of arrays '(bboxes, data)' or, if 'return_indices',
+        the int64 array of the items ids.  Items ids are their position in
+        the loaded arrays: for a tree built by a single 'load' they index
+        the loaded 'arr' (and 'data') rows.
+        """
+        with self._lock.read():
+            if self._packed is not None:
+                found = packed.search(self._packed, xmin, ymin, xmax, ymax,
+                                      dead=self._dead_flags())
+                return self._packed_items(found, return_indices)
+            items = search(self._root, xmin, ymin, xmax, ymax)
+            return self._node_items(items, return_indices)
+
+    def count(self, xmin, ymin, xmax, ymax):
+        """
+        Return the number of items intersecting with 'xmin,ymin,xmax,ymax'
+        """
+        with self._lock.read():
+            if self._packed is not None:
+                return int(packed.count(self._packed, xmin, ymin, xmax, ymax,
+                                        dead=self._dead_flags()))
+            return count(self._root, xmin, ymin, xmax, ymax,
+                         dead=self._dead_flags())
+
+    def collides(self, xmin, ymin, xmax, ymax):
+        """
+        Return True if any item intersects with 'xmin,ymin,xmax,ymax'
         """
-        items = search(self._root, xmin, ymin, xmax, ymax)
-        return map(np.asarray, zip(*items))
+        with self._lock.read():
+            if self._packed is not None:
+                return packed.collides(self._packed, xmin, ymin, xmax, ymax,
+                                       dead=self._dead_flags())
+            return collides(self._root, xmin, ymin, xmax, ymax,
+                            dead=self._dead_flags())
+
+    def knn(self, x, y, k, max_distance=None):
+        """
+        Return the 'k' items nearest to point 'x,y'
+
+        Items farther than 'max_distance' (if given) are left out, thus
+        less than 'k' items may be returned.
 
-    def remove(self, xmin, ymin, xmax, ymax):
+        Output:
+         - indices   : numpy.ndarray of items ids (see 'search')
+         - distances : numpy.ndarray of items distances, in increasing order
         """
-        Remove and return removed items matching 'xmin,ymin,xmax,ymax'
+        with self._lock.read():
+            if self._packed is not None:
+                found, distances = packed.knn(self._packed, x, y, k,
+                                              max_distance,
+                                              dead=self._dead_flags())
+                return self._packed.items[found], distances
+
+            items = knn(self._root, x, y, k, max_distance,
+                        dead=self._dead_flags())
+        indices = np.array([idf(item) for _, item in items], dtype=np.int64)
+        distances = np.array([dist for dist, _ in items], dtype=np.float64)
+        return indices, distances
+
+    def knn_many(self, points, k, max_distance=None, workers=1):
         """
-        items = remove(self._root, xmin, ymin, xmax, ymax)
-        if self.empty:
-            self.clear()
+        Return the 'k' items nearest to each of the 'points' at once
+
+        Rows are padded with id '-1' and distance 'inf' when less than 'k'
+        items are found (see 'knn').
+
+        Input:
+         - points       : numpy.ndarray of shape (Q,2) ('x,y')
+         - k            : number of neighbours
+         - max_distance : None or maximum distance of neighbours
+         - workers      : number of threads to split points across (-1 for all)
+
+        Output:
+         - indices   : numpy.ndarray of shape (Q,k), items ids
+         - distances : numpy.ndarray of shape (Q,k), items distances
+        """
+        points = np.asarray(points)
+        if points.ndim != 2 or points.shape[1] != 2:
+            msg = ("Error: 'points' shape mismatch, was expecting (Q,2)")
+            raise ValueError(msg)
+
+        with self._lock.read():
+            tree = self._batch_tree(len(points))
+            if tree is None:
+                indices = np.full((len(points), k), -1, dtype=np.int64)
+                distances = np.full((len(points), k), np.inf)
+                for q in range(len(points)):
+                    items = knn(self._root, points[q, 0], points[q, 1], k,
+                                max_distance, dead=self._dead_flags())
+                    for j, (dist, item) in enumerate(items):
+                        indices[q, j] = idf(item)
+                        distances[q, j] = dist
+                return indices, distances
+            found, distances = packed.knn_many(tree, points, k, max_distance,
+                                               workers=workers,
+                                               dead=self._dead_flags())
+            indices = np.full_like(found, -1)
+            indices[found >= 0] = tree.items[found[found >= 0]]
+            return indices, distances
+
+    def search_many(self, queries, workers=1):
+        """
+        Search items intersecting each of the 'queries' bboxes at once
+
+        Output is in CSR format: ids of the items matching query 'i' are
+        'indices[offsets[i]:offsets[i+1]]'.
+
+        Input:
+         - queries : numpy.ndarray of shape (Q,4) ('xmin,ymin,xmax,ymax')
+         - workers : number of threads to split queries across (-1 for all)
+
+        Output:
+         - offsets : numpy.ndarray of shape (Q+1,)
+         - indices : numpy.ndarray of items ids
+        """
+        queries = np.asarray(queries)
+        if queries.ndim != 2 or queries.shape[1] != 4:
+            msg = ("Error: 'queries' shape mismatch, was expecting (Q,4)")
+            raise ValueError(msg)
+
+        with self._lock.read():
+            tree = self._batch_tree(len(queries))
+            if tree is None:
+                found = [self._node_items(search(self._root, *query), True)
+                         for query in queries]
+                offsets = np.zeros(len(queries) + 1, dtype=np.int64)
+                offsets[1:] = np.cumsum([len(ids) for ids in found])
+                if not found:
+                    return offsets, np.empty(0, dtype=np.int64)
+                return offsets, np.concatenate(found)
+            offsets, found = packed.search_many(tree, queries,
+                                                workers=workers,
+                                                dead=self._dead_flags())
+            return offsets, tree.items[found]
+
+    def _packed_items(self, positions, return_indices=False):
+        """
+        Return (bboxes, data) arrays of packed items at 'positions'
+        """
+        if return_indices:
+            return self._packed.items[positions]
+        bboxes = self._packed.item_bboxes[positions]
+        if self._packed.data is None:
+            data = np.empty(len(bboxes), dtype=object)
+        else:
+            data = self._packed.data[positions]
+        return bboxes, data
+
+    def _node_items(self, items, return_indices=False):
+        """
+        Return (bboxes, data) arrays of (nodes) 'items'
+        """
+        if self._ndead:
+            items = [item for item in items
+                     if not is_dead(item, self._dead)]
+        if return_indices:
+            return np.array([idf(item) for item in items], dtype=np.int64)
+        if not len(items):
+            return np.empty((0, 4)), np.empty(0, dtype=object)
+        bboxes = np.asarray([bbox for bbox, _, _ in items])
+        data = packed.data_array([data for _, data, _ in items])
+        return bboxes, data
+
+    def remove(self, xmin, ymin=None, xmax=None, ymax=None):
+        """
+        Remove and return removed items
+
+        Either 'remove(item_id)' removes the item with the given id (as
+        returned by 'search(..., return_indices=True)'), or
+        'remove(xmin, ymin, xmax, ymax)' removes the items with that bbox.
+        Items already discarded are cleared out, but not returned.
+
+        Output:
+         - items : list of removed (bbox, data, id) items
+        """
+        with self._lock.write():
+            root = self._unpack()
+            if ymin is None and xmax is None and ymax is None:
+                self._thaw([xmin])
+                root, items = remove_id(root, xmin, self.maxentries,
+                                        self.minentries, self._index,
+                                        self.strategy, self.split_method)
+            else:
+                root, items = remove(root, xmin, ymin, xmax, ymax,
+                                     self.maxentries, self.minentries,
+                                     self._index, self.strategy,
+                                     self.split_method)
+            self._root = root
+            if self._ndead:
+                alive = [item for item in items
+                         if not is_dead(item, self._dead)]
+                self._ndead -= len(items) - len(alive)
+                items = alive
+            if self.empty:
+                next_id = self._next_id
+                self.clear()
+                self._next_id = next_id
+                # all ids given so far are gone (see 'compact')
+                self._dead = np.ones(next_id, dtype=bool)
         return items
 
+    def update(self, item_id, xmin, ymin, xmax, ymax):
+        """
+        Move item 'item_id' to bbox 'xmin,ymin,xmax,ymax'
+
+        The item keeps its id and data. It stays in its leaf if the new bbox
+        fits there (or in the leaf parent), otherwise it is inserted again.
+
+        Output:
+         - self : RBush
+        """
+        with self._lock.write():
+            root = self._unpack()
+            if item_id not in self._index or not self._alive([item_id])[0]:
+                msg = "Error: no item with id {}".format(item_id)
+                raise ValueError(msg)
+            self._thaw([item_id])
+            self._root = update(root, item_id, xmin, ymin, xmax, ymax,
+                                maxentries=self.maxentries,
+                                minentries=self.minentries,
+                                index=self._index, strategy=self.strategy,
+                                split_method=self.split_method)
+        return self
+
+    def update_many(self, ids, xmin, ymin, xmax, ymax):
+        """
+        Move items 'ids' to bboxes 'xmin,ymin,xmax,ymax' (arrays of size N)
+
+        As 'update', for many items at once; those moved out of their leaf
+        are inserted back together.
+
+        Output:
+         - self : RBush
+        """
+        ids = np.asarray(ids)
+        xmin, ymin, xmax, ymax = (np.asarray(a) for a in (xmin, ymin,
+                                                          xmax, ymax))
+        if not len(ids) == len(xmin) == len(ymin) == len(xmax) == len(ymax):
+            msg = ("Error: Arguments 'ids','xmin','ymin','xmax','ymax'"
+                   " have different lengths")
+            raise ValueError(msg)
+        if len(np.unique(ids)) != len(ids):
+            msg = "Error: Argument 'ids' has repeated ids"
+            raise ValueError(msg)
+
+        with self._lock.write():
+            root = self._unpack()
+            alive = self._alive(ids)
+            for i, item_id in enumerate(ids):
+                if item_id not in self._index or not alive[i]:
+                    msg = "Error: no item with id {}".format(item_id)
+                    raise ValueError(msg)
+            self._thaw(ids)
+            self._root = update_many(root, ids, xmin, ymin, xmax, ymax,
+                                     maxentries=self.maxentries,
+                                     minentries=self.minentries,
+                                     index=self._index,
+                                     strategy=self.strategy,
+                                     split_method=self.split_method)
+        return self
+
+    def discard(self, ids, max_dead=MAXDEAD):
+        """
+        Remove lazily the items 'ids' (a scalar or array-like)
+
+        Items are only flagged as dead, queries leaving them out, until
+        'compact' drops them for good; it is run here once more than a
+        fraction 'max_dead' of the stored items are dead.  Unknown (or
+        already removed) ids are ignored.
+
+        Output:
+         - self : RBush
+        """
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        with self._lock.write():
+            ids = np.unique(ids[(ids >= 0) & (ids < self._next_id)])
+            if self._root is not None:
+                ids = np.array([i for i in ids if i in self._index],
+                               dtype=np.int64)
+            if len(self._dead) < self._next_id:
+                dead = np.zeros(max(self._next_id, 2 * len(self._dead)),
+                                dtype=bool)
+                dead[:len(self._dead)] = self._dead
+                self._dead = dead
+            elif not self._dead.flags.writeable:
+                # shared with a snapshot
+                self._dead = self._dead.copy()
+            ids = ids[~self._dead[ids]]
+            self._dead[ids] = True
+            self._ndead += len(ids)
+        return self.compact(max_dead)
+
+    def compact(self, max_dead=0):
+        """
+        Drop the discarded items (see 'discard'), if more than a fraction
+        'max_dead' of the stored items are, rebuilding (packing) the tree
+        from the live ones
+
+        Output:
+         - self : RBush
+        """
+        with self._lock.write():
+            if not self._ndead or self._ndead <= max_dead * self._size():
+                return self
+            ids = self.all(return_indices=True)
+            bboxes, data = self.all()
+            if all(d is None for d in data):
+                data = None
+
+            next_id = self._next_id
+            self.clear()
+            self._next_id = next_id
+            # ids not alive now never will, flag them all
+            self._dead = np.ones(next_id, dtype=bool)
+            self._dead[ids] = False
+            if len(ids):
+                self._packed = pack(bboxes, self.maxentries, data, ids=ids)
+                self._root = None
+                self._index = None
+        return self
+
+    def snapshot(self):
+        """
+        Return a read-only copy of the tree, as it is now
+
+        Snapshots are cheap and need no locking: they share the tree nodes,
+        which later modifications of the tree copy (only those along the
+        modified paths) rather than change. Modifying a snapshot raises a
+        ValueError. Snapshots taken while another thread modifies the tree
+        need a 'threadsafe' tree (waiting for the modification to end).
+
+        Output:
+         - snapshot : RBush
+        """
+        with self._lock.read():
+            snapshot = RBush(self.maxentries, self.minentries,
+                             strategy=self.strategy, split=self.split_method)
+            snapshot._set_state(self._root, self._packed, self._next_id,
+                                self._dead, self._ndead)
+            snapshot._lock = ReadOnly()
+            if self._root is not None:
+                freeze(self._root)
+                self._shared = True
+            self._dead.flags.writeable = False
+            return snapshot
+
+    def share(self, name=None):
+        """
+        Copy the (packed) tree in a new shared memory block, for processes
+        to 'attach' to it without copying, nor building it again
+
+        It is up to the caller to keep the block open while in use, then to
+        'close' and 'unlink' it. Items data, if any, must be a numpy array
+        of numbers (or strings), not python objects. Needs python >= 3.8.
+
+        Input:
+         - name : None, or name of the shared memory block to create
+
+        Output:
+         - block : multiprocessing.shared_memory.SharedMemory (see its
+                   'name')
+        """
+        with self._lock.read():
+            attrs, arrays = self._state()
+            return _storage.share(attrs, arrays, name)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Return a read-only tree over the shared memory block 'name' (see
+        'share'), reading its arrays in place
+
+        Output:
+         - tree : RBush
+        """
+        attrs, arrays, block = _storage.attach(name)
+        tree = cls._from_state(attrs, arrays)
+        tree._lock = ReadOnly()
+        # the arrays are views of the block, keep it mapped
+        tree._block = block
+        return tree
+
+    def save(self, path):
+        """
+        Write the (packed) tree to file 'path', to be read by 'open'
+
+        The file holds a header then the packed tree arrays (nodes bboxes,
+        children offsets, items ids and bboxes, and items data if any) as
+        they are in memory (see 'rbush._storage'). Items data, if any, must
+        be a numpy array of numbers (or strings), not python objects.
+
+        Output:
+         - self : RBush
+        """
+        with self._lock.read():
+            attrs, arrays = self._state()
+            _storage.save(path, attrs, arrays)
+        return self
+
+    @classmethod
+    def open(cls, path, mmap=True):
+        """
+        Return the tree saved to file 'path' (see 'save')
+
+        With 'mmap', the file is memory-mapped rather than read: opening is
+        immediate whatever its size, and queries only read from disk the
+        pages they go through. The tree can be modified either way (it is
+        then unpacked in memory, see 'insert').
+
+        Output:
+         - tree : RBush
+        """
+        attrs, arrays = _storage.load(path, mmap)
+        return cls._from_state(attrs, arrays)
+
+    def _state(self):
+        """
+        Return the attributes and arrays of the (packed) tree, to store it
+        """
+        attrs = dict(maxentries=self.maxentries, minentries=self.minentries,
+                     strategy=self.strategy, split=self.split_method,
+                     next_id=int(self._next_id), ndead=int(self._ndead))
+        arrays = self._pack()._asdict()
+        arrays['dead'] = self._dead_flags()
+        if self._ndead:
+            # shared with the state from now on ('discard' copies it)
+            self._dead.flags.writeable = False
+        return attrs, arrays
+
+    @classmethod
+    def _from_state(cls, attrs, arrays):
+        """
+        Return the (packed) tree of the stored attributes and arrays (see
+        '_state')
+        """
+        tree = cls.__new__(cls)
+        tree.__setstate__(dict(attrs, arrays=arrays))
+        return tree
+
+    def __getstate__(self):
+        # pickled as the few arrays of the packed tree (sent out-of-band
+        # with pickle protocol 5), rather than as nested nodes
+        with self._lock.read():
+            attrs, arrays = self._state()
+        attrs['threadsafe'] = isinstance(self._lock, RWLock)
+        attrs['arrays'] = arrays
+        return attrs
+
+    def __setstate__(self, state):
+        attrs = dict(state)
+        arrays = attrs.pop('arrays')
+        self.__init__(attrs['maxentries'], attrs['minentries'],
+                      strategy=attrs['strategy'], split=attrs['split'],
+                      threadsafe=attrs.get('threadsafe', False))
+        dead = arrays.get('dead')
+        if dead is None:
+            dead = np.zeros(0, dtype=bool)
+        fields = dict((name, arrays.get(name))
+                      for name in packed.PackedTree._fields)
+        self._set_state(None, packed.PackedTree(**fields),
+                        attrs['next_id'], dead, attrs['ndead'])
+
+    def to_bytes(self):
+        """
+        Return the (packed) tree serialized, as bytes (see 'from_bytes')
+
+        Bytes are laid out as the file written by 'save'. Items data, if
+        any, must be a numpy array of numbers (or strings), not python
+        objects.
+
+        Output:
+         - buffer : bytes
+        """
+        with self._lock.read():
+            attrs, arrays = self._state()
+            return _storage.dumps(attrs, arrays)
+
+    @classmethod
+    def from_bytes(cls, buffer):
+        """
+        Return the tree serialized in 'buffer' (see 'to_bytes')
+
+        Its arrays are read in place from 'buffer' (any bytes-like object),
+        which must not change afterwards.
+
+        Output:
+         - tree : RBush
+        """
+        attrs, arrays = _storage.decode(buffer)
+        return cls._from_state(attrs, arrays)
+
+    def _set_state(self, root, packed_tree, next_id, dead, ndead):
+        """
+        Make this (new) tree hold the given tree state
+        """
+        self._root = root
+        self._packed = packed_tree
+        self._next_id = next_id
+        self._index = None
+        self._dead = dead
+        self._ndead = ndead
+        return self
+
     def to_json(self, indent=2):
-        return to_json(self._root, indent)
+        with self._lock.read():
+            if self._root is None:
+                return to_json(unpack(self._packed), indent)
+            return to_json(self._root, indent)
 
 
 def to_json(node, indent=None):
@@ -1,4 +1,5 @@
 import numba as nb
+import numpy as np
 
 from ._python import *
 
@@ -18,127 +19,268 @@ def min(x, y):
 
 
 def xminf(node):
-    return node[0][0]
+    return node.bbox[0]
 
 
 def yminf(node):
-    return node[0][1]
+    return node.bbox[1]
 
 
 def xmaxf(node):
-    return node[0][2]
+    return node.bbox[2]
 
 
 def ymaxf(node):
-    return node[0][3]
+    return node.bbox[3]
 
 
 def leaff(node):
-    return node[2]
+    return node.leaf
 
 
 def childrenf(node):
-    return node[1]
+    return node.children
 
 
 def heightf(node):
-    return node[-1]
+    return node.height
 
 
-# @profile
-def calc_enlarged_area(a, b):
-    return _calc_enlarged_area(xminf(a), yminf(a), xmaxf(a), ymaxf(a),
-                               xminf(b), yminf(b), xmaxf(b), ymaxf(b))
+def idf(item):
+    return item.id
 
 
-# @nb.njit
-def _calc_enlarged_area(axmin, aymin, axmax, aymax,
-                        bxmin, bymin, bxmax, bymax):
-    sectx = max(axmax, bxmax) - min(axmin, bxmin)
-    secty = max(aymax, bymax) - min(aymin, bymin)
-    return sectx * secty
+def child_boxes(node):
+    """
+    Return the (n,4) array of 'node' children bboxes, cached in the node
+    """
+    if node.boxes is None:
+        bboxes = [child.bbox for child in childrenf(node)]
+        node.boxes = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+    return node.boxes
 
 
-# @profile
-def extend(a, b):
+def reset_boxes(node):
     """
-    Return 'a' box enlarged by 'b'
+    Drop the children bboxes cached in 'node' (after its children changed)
     """
-    xmin, ymin, xmax, ymax = _extend(xminf(a), yminf(a), xmaxf(a), ymaxf(a),
-                                     xminf(b), yminf(b), xmaxf(b), ymaxf(b))
-    a = create_node([xmin, ymin, xmax, ymax],
-                    leaf=leaff(a), height=heightf(a), children=childrenf(a))
-    return a
+    node.boxes = None
 
 
-# @nb.njit
-def _extend(axmin, aymin, axmax, aymax,
-            bxmin, bymin, bxmax, bymax):
-    xmin = min(axmin, bxmin)
-    ymin = min(aymin, bymin)
-    xmax = max(axmax, bxmax)
-    ymax = max(aymax, bymax)
-    return xmin, ymin, xmax, ymax
+def freeze(node):
+    """
+    Mark 'node' (and so its whole subtree) as shared, never to be modified
+    """
+    node.frozen = True
+    return node
 
 
-def calc_bbox_margin(bbox):
-    return (xmaxf(bbox) - xminf(bbox)) + (ymaxf(bbox) - yminf(bbox))
+def thaw(node, index=None):
+    """
+    Return a modifiable copy of frozen 'node'; its children, now shared by
+    both, get frozen in turn (copy on write, one level at a time)
 
+    'index', if given, is the id->leaf dict to point to the copy of a leaf.
+    """
+    copy = create_node(node.bbox, leaf=leaff(node), height=heightf(node),
+                       children=list(childrenf(node)))
+    if node.boxes is not None:
+        copy.boxes = node.boxes.copy()
+    if not leaff(node):
+        for child in childrenf(copy):
+            child.frozen = True
+    elif index is not None:
+        for item in childrenf(copy):
+            index[idf(item)] = copy
+    return copy
+
+
+def thaw_child(node, i, index=None):
+    """
+    Return child 'i' of (modifiable) 'node', replaced first by a copy if
+    frozen (see 'thaw')
+    """
+    child = childrenf(node)[i]
+    if child.frozen:
+        child = thaw(child, index)
+        childrenf(node)[i] = child
+    return child
 
-# @profile
-def calc_dist_xmargin(node, minentries):
-    sort_xmargin(node)
-    return calc_dist_margin(node, minentries)
 
+def choose_child(node, bbox):
+    """
+    Return the index of the child of 'node' whose box needs the least
+    enlargement to include 'bbox' (the smallest one on ties); the cached
+    box of that child is enlarged accordingly
+    """
+    return _choose_child(child_boxes(node),
+                         xminf(bbox), yminf(bbox), xmaxf(bbox), ymaxf(bbox))
 
-# @profile
-def calc_dist_ymargin(node, minentries):
-    sort_ymargin(node)
-    return calc_dist_margin(node, minentries)
 
+def choose_child_overlap(node, bbox):
+    """
+    As 'choose_child', picking the child whose box enlargement adds the
+    least overlap with its siblings (R*-tree criterion), then the least
+    enlargement, then the smallest one
+    """
+    return _choose_child_overlap(child_boxes(node), xminf(bbox), yminf(bbox),
+                                 xmaxf(bbox), ymaxf(bbox))
 
-def sort_xmargin(node):
-    childrenf(node).sort(key=lambda a: xminf(a))
-    return node
 
+def farthest_children(node, fraction):
+    """
+    Return the indexes of the 'fraction' of the children of 'node' whose
+    centres are the farthest from the node centre, the nearest first
+    """
+    boxes = child_boxes(node)
+    num_children = max(1, int(fraction * len(boxes)))
+    dx = (boxes[:, 0] + boxes[:, 2]) - (xminf(node) + xmaxf(node))
+    dy = (boxes[:, 1] + boxes[:, 3]) - (yminf(node) + ymaxf(node))
+    order = np.argsort(dx * dx + dy * dy, kind='mergesort')
+    return order[len(boxes) - num_children:]
 
-def sort_ymargin(node):
-    childrenf(node).sort(key=lambda a: yminf(a))
-    return node
 
+def route_items(node, boxes):
+    """
+    Return, for each row of 'boxes' (N,4) array, the index of the child of
+    'node' to insert it in (as 'choose_child' does, one after the other)
+    """
+    return _route_items(child_boxes(node), boxes)
+
+
+@nb.njit(nogil=True, cache=True)
+def _route_items(children, boxes):
+    targets = np.empty(boxes.shape[0], np.int64)
+    for i in range(boxes.shape[0]):
+        targets[i] = _choose_child(children, boxes[i, 0], boxes[i, 1],
+                                   boxes[i, 2], boxes[i, 3])
+    return targets
+
+
+@nb.njit(nogil=True, cache=True)
+def _choose_child(boxes, xmin, ymin, xmax, ymax):
+    index = 0
+    min_enlargement = np.inf
+    min_area = np.inf
+    for i in range(boxes.shape[0]):
+        bxmin, bymin, bxmax, bymax = boxes[i, 0], boxes[i, 1], \
+                                     boxes[i, 2], boxes[i, 3]
+        area = (bxmax - bxmin) * (bymax - bymin)
+        enlarged = ((bxmax if bxmax > xmax else xmax) -
+                    (bxmin if bxmin < xmin else xmin)) * \
+                   ((bymax if bymax > ymax else ymax) -
+                    (bymin if bymin < ymin else ymin))
+        enlargement = enlarged - area
+
+        # choose entry with the least area enlargement
+        if enlargement < min_enlargement:
+            min_enlargement = enlargement
+            if area < min_area:
+                min_area = area
+            index = i
+        elif enlargement == min_enlargement and area < min_area:
+            # otherwise choose one with the smallest area
+            min_area = area
+            index = i
 
-# @profile
-def calc_dist_margin(node, minentries):
-    M = len(childrenf(node))
-    m = minentries
+    if boxes.shape[0] > 0:
+        _extend_row(boxes, index, xmin, ymin, xmax, ymax)
+    return index
 
-    bbox_left = calc_bbox(node, 0, m)
-    bbox_right = calc_bbox(node, M - m, M)
-    margin = calc_bbox_margin(bbox_left) + calc_bbox_margin(bbox_right)
 
-    for i in range(m, M - m):
-        child = get(childrenf(node), i)
-        bbox_left = extend(bbox_left, child)
-        margin = margin + calc_bbox_margin(bbox_left)
+@nb.njit(nogil=True, cache=True)
+def _choose_child_overlap(boxes, xmin, ymin, xmax, ymax):
+    index = 0
+    min_overlap = np.inf
+    min_enlargement = np.inf
+    min_area = np.inf
+    for i in range(boxes.shape[0]):
+        bxmin, bymin, bxmax, bymax = boxes[i, 0], boxes[i, 1], \
+                                     boxes[i, 2], boxes[i, 3]
+        exmin = bxmin if bxmin < xmin else xmin
+        eymin = bymin if bymin < ymin else ymin
+        exmax = bxmax if bxmax > xmax else xmax
+        eymax = bymax if bymax > ymax else ymax
+        area = (bxmax - bxmin) * (bymax - bymin)
+        enlargement = (exmax - exmin) * (eymax - eymin) - area
+
+        overlap = 0.0
+        if enlargement > 0:
+            for j in range(boxes.shape[0]):
+                if j != i:
+                    overlap += (
+                        _overlap(boxes, j, exmin, eymin, exmax, eymax) -
+                        _overlap(boxes, j, bxmin, bymin, bxmax, bymax))
+
+        if (overlap < min_overlap or
+                (overlap == min_overlap and
+                 (enlargement < min_enlargement or
+                  (enlargement == min_enlargement and area < min_area)))):
+            min_overlap = overlap
+            min_enlargement = enlargement
+            min_area = area
+            index = i
+
+    if boxes.shape[0] > 0:
+        _extend_row(boxes, index, xmin, ymin, xmax, ymax)
+    return index
 
-    for i in range(M-m-1, m-1, -1):
-        child = get(childrenf(node), i)
-        bbox_right = extend(bbox_right, child)
-        margin = margin + calc_bbox_margin(bbox_right)
 
-    return margin
+@nb.njit(nogil=True, cache=True)
+def _overlap(boxes, j, xmin, ymin, xmax, ymax):
+    """
+    Return the area shared by box 'j' and 'xmin,ymin,xmax,ymax'
+    """
+    width = ((boxes[j, 2] if boxes[j, 2] < xmax else xmax) -
+             (boxes[j, 0] if boxes[j, 0] > xmin else xmin))
+    height = ((boxes[j, 3] if boxes[j, 3] < ymax else ymax) -
+              (boxes[j, 1] if boxes[j, 1] > ymin else ymin))
+    if width <= 0 or height <= 0:
+        return 0.0
+    return width * height
+
+
+@nb.njit(nogil=True, cache=True)
+def _extend_row(boxes, index, xmin, ymin, xmax, ymax):
+    if xmin < boxes[index, 0]:
+        boxes[index, 0] = xmin
+    if ymin < boxes[index, 1]:
+        boxes[index, 1] = ymin
+    if xmax > boxes[index, 2]:
+        boxes[index, 2] = xmax
+    if ymax > boxes[index, 3]:
+        boxes[index, 3] = ymax
+
+
+# @profile
+def calc_enlarged_area(a, b):
+    return _calc_enlarged_area(xminf(a), yminf(a), xmaxf(a), ymaxf(a),
+                               xminf(b), yminf(b), xmaxf(b), ymaxf(b))
+
+
+# @nb.njit
+def _calc_enlarged_area(axmin, aymin, axmax, aymax,
+                        bxmin, bymin, bxmax, bymax):
+    sectx = max(axmax, bxmax) - min(axmin, bxmin)
+    secty = max(aymax, bymax) - min(aymin, bymin)
+    return sectx * secty
 
 
-def calc_bbox(node, left_index, right_index, destnode=None):
+# @profile
+def extend(a, b):
     """
-    Return a node enlarged by all children between left/right
+    Enlarge (in place) and return 'a' box by 'b'
     """
-    if destnode is None:
-        destnode = create_node([INF, INF, -INF, -INF])
-    for i in range(left_index, right_index):
-        child = get(childrenf(node), i)
-        destnode = extend(destnode, child)
-    return destnode
+    bbox = a.bbox
+    if xminf(b) < bbox[0]:
+        bbox[0] = xminf(b)
+    if yminf(b) < bbox[1]:
+        bbox[1] = yminf(b)
+    if xmaxf(b) > bbox[2]:
+        bbox[2] = xmaxf(b)
+    if ymaxf(b) > bbox[3]:
+        bbox[3] = ymaxf(b)
+    return a
 
 
 def calc_bbox_children_indexes(children, i_ini, i_fin):
@@ -147,11 +289,15 @@ def calc_bbox_children_indexes(children, i_ini, i_fin):
     ymin = INF
     ymax = -INF
     for i in range(i_ini, i_fin):
-        child = get(children, i)
-        xmin = min(xmin, xminf(child))
-        ymin = min(ymin, yminf(child))
-        xmax = max(xmax, xmaxf(child))
-        ymax = max(ymax, ymaxf(child))
+        bbox = children[i].bbox
+        if bbox[0] < xmin:
+            xmin = bbox[0]
+        if bbox[1] < ymin:
+            ymin = bbox[1]
+        if bbox[2] > xmax:
+            xmax = bbox[2]
+        if bbox[3] > ymax:
+            ymax = bbox[3]
     return (xmin, ymin, xmax, ymax)
 
 
@@ -161,44 +307,46 @@ def calc_bbox_children(children):
 
 def adjust_bbox(node):
     """
-    Update node borders after its children
+    Update (in place) node borders after its children
     """
-    bbox = calc_bbox_children(childrenf(node))
-    new_node = create_node(bbox, children=childrenf(node),
-                           leaf=leaff(node), height=heightf(node))
-    return new_node
+    node.bbox[:] = calc_bbox_children(childrenf(node))
+    return node
 
 
 def adjust_bboxes(bbox, path):
     # adjust bboxes along the given tree path
-    # for i in range(len(path)-1, -1, -1):
-    #     extend(path[i], bbox)
-    new_path = []
-    child = None
     for i in range(len(path)-1, -1, -1):
-        node = extend(path[i], bbox)
-        if child is not None:
-            substitute(node, path[i+1], child)
-        child = node
-        new_path.append(node)
-    new_path.reverse()
-    return new_path
+        extend(path[i], bbox)
+    return path
 
 
-def substitute(parent, old_child, new_child):
-    childrenf(parent).remove(old_child)
-    childrenf(parent).append(new_child)
+# @profile
+def split(node, minentries, method='rstar'):
+    """
+    Split 'node' in two, moving some of its children to a new node
 
+    'method' is the split algorithm: 'rstar' (R*-tree: sort the children
+    along the axis of least margin, cut where the two halves overlap
+    least), 'quadratic' or 'linear' (Guttman). Return both nodes.
+    """
+    children = childrenf(node)
+    boxes = child_boxes(node)
+    if method == 'rstar':
+        order, index = _split_rstar(boxes, minentries)
+        children[:] = [children[i] for i in order]
+        adopted = children[index:]
+        del children[index:]
+    elif method in ('quadratic', 'linear'):
+        if method == 'quadratic':
+            second = _split_quadratic(boxes, minentries)
+        else:
+            second = _split_linear(boxes, minentries)
+        adopted = [child for child, s in zip(children, second) if s]
+        children[:] = [child for child, s in zip(children, second) if not s]
+    else:
+        raise ValueError("Error: unknown split method '{}'".format(method))
 
-# @profile
-def split(node, minentries):
-    sort_splitaxis(node, minentries)
-    index = choose_splitindex(node, minentries)
-    if index is None:
-        index = minentries
-
-    num_children = len(childrenf(node)) - index
-    adopted = splice(childrenf(node), index, num_children)
+    reset_boxes(node)
     bbox = calc_bbox_children(adopted)
     new_node = create_node(bbox, height=heightf(node),
                            leaf=leaff(node), children=adopted)
@@ -209,60 +357,229 @@ def split(node, minentries):
     return node, new_node
 
 
-# @profile
-def sort_splitaxis(node, minentries):
-    xmargin = calc_dist_xmargin(node, minentries)
-    ymargin = calc_dist_ymargin(node, minentries)
-    if (xmargin < ymargin):
-        sort_xmargin(node)
-    return node
+@nb.njit(nogil=True, cache=True)
+def _split_rstar(boxes, minentries):
+    """
+    Return the order of 'boxes' along the split axis and the split index
 
+    The axis is the one whose distributions have the least total margin;
+    the index the distribution with the least overlap, then least area.
+    Prefix/suffix bboxes make it O(M log M), instead of O(M^2).
+    """
+    # (stable) sorts by xmin, then ymin, as successive in place sorts
+    xorder = np.argsort(boxes[:, 0], kind='mergesort')
+    yorder = xorder[np.argsort(boxes[xorder, 1], kind='mergesort')]
+    xmargin = _split_margin(_prefix_bboxes(boxes, xorder),
+                            _suffix_bboxes(boxes, xorder), minentries)
+    ymargin = _split_margin(_prefix_bboxes(boxes, yorder),
+                            _suffix_bboxes(boxes, yorder), minentries)
+    order = yorder
+    if xmargin < ymargin:
+        order = yorder[np.argsort(boxes[yorder, 0], kind='mergesort')]
+
+    prefix = _prefix_bboxes(boxes, order)
+    suffix = _suffix_bboxes(boxes, order)
+    M = len(order)
+    index = minentries
+    min_overlap = np.inf
+    min_area = np.inf
+    for i in range(minentries, M - minentries + 1):
+        # children [0, i) against [i, M)
+        a = prefix[i - 1]
+        b = suffix[i]
+        width = min(a[2], b[2]) - max(a[0], b[0])
+        height = min(a[3], b[3]) - max(a[1], b[1])
+        overlap = max(0.0, width) * max(0.0, height)
+        area = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1])
 
-# @profile
-def choose_splitindex(node, minentries):
-    '''
-    Return the index (children) where to split
-
-    Split position tries to minimize (primarily) the boxes overlap
-    and, secondly, the area cover by each combination of boxes.
-    '''
-    M = len(childrenf(node))
+        # choose distribution with minimum overlap
+        if overlap < min_overlap:
+            min_overlap = overlap
+            index = i
+            if area < min_area:
+                min_area = area
+        elif overlap == min_overlap and area < min_area:
+            # otherwise choose distribution with minimum area
+            min_area = area
+            index = i
+    return order, index
+
+
+@nb.njit(nogil=True, cache=True)
+def _prefix_bboxes(boxes, order):
+    # row i: bbox of boxes order[0], ..., order[i]
+    bboxes = np.empty((len(order), 4))
+    bboxes[0] = boxes[order[0]]
+    for i in range(1, len(order)):
+        _union_row(bboxes, i, bboxes[i - 1], boxes[order[i]])
+    return bboxes
+
+
+@nb.njit(nogil=True, cache=True)
+def _suffix_bboxes(boxes, order):
+    # row i: bbox of boxes order[i], ..., order[-1]
+    M = len(order)
+    bboxes = np.empty((M, 4))
+    bboxes[M - 1] = boxes[order[M - 1]]
+    for i in range(M - 2, -1, -1):
+        _union_row(bboxes, i, bboxes[i + 1], boxes[order[i]])
+    return bboxes
+
+
+@nb.njit(nogil=True, cache=True)
+def _union_row(bboxes, i, a, b):
+    bboxes[i, 0] = min(a[0], b[0])
+    bboxes[i, 1] = min(a[1], b[1])
+    bboxes[i, 2] = max(a[2], b[2])
+    bboxes[i, 3] = max(a[3], b[3])
+
+
+@nb.njit(nogil=True, cache=True)
+def _split_margin(prefix, suffix, minentries):
+    """
+    Return the margins sum of every (left, right) split distribution
+    """
+    M = len(prefix)
     m = minentries
+    margin = _margin(prefix[m - 1]) + _margin(suffix[M - m])
+    for i in range(m, M - m):
+        margin += _margin(prefix[i])
+    for i in range(M - m - 1, m - 1, -1):
+        margin += _margin(suffix[i])
+    return margin
 
-    minArea = INF
-    minOverlap = INF
 
-    index = None
-    for i in range(m, M - m + 1):
-        bbox1 = calc_bbox(node, 0, i)
-        bbox2 = calc_bbox(node, i, M)
+@nb.njit(nogil=True, cache=True)
+def _margin(bbox):
+    return (bbox[2] - bbox[0]) + (bbox[3] - bbox[1])
 
-        overlap = calc_intersection_area(bbox1, bbox2)
-        area = calc_bbox_area(bbox1) + calc_bbox_area(bbox2)
 
-        # choose distribution with minimum overlap
-        if (overlap < minOverlap):
-            minOverlap = overlap
-            index = i
-            if area < minArea:
-                minArea = area
+@nb.njit(nogil=True, cache=True)
+def _split_quadratic(boxes, minentries):
+    """
+    Guttman quadratic split: return which 'boxes' go to the second group
 
-        else:
-            if overlap == minOverlap:
-                # otherwise choose distribution with minimum area
-                if area < minArea:
-                    minArea = area
+    Seeds are the pair of boxes wasting the most area when grouped; then
+    the box with the greatest preference for one group goes next.
+    """
+    M = len(boxes)
+    seed1, seed2 = 0, 1
+    max_waste = -np.inf
+    for i in range(M):
+        for j in range(i + 1, M):
+            waste = (_enlarged_area(boxes[i], boxes[j]) -
+                     _area(boxes[i]) - _area(boxes[j]))
+            if waste > max_waste:
+                max_waste = waste
+                seed1, seed2 = i, j
+
+    groups, bboxes, sizes = _split_seeds(boxes, seed1, seed2)
+    for _ in range(M - 2):
+        # pick next: the box whose enlargements differ the most
+        index = -1
+        max_diff = -np.inf
+        for i in range(M):
+            if groups[i] < 0:
+                diff = abs((_enlarged_area(bboxes[0], boxes[i]) -
+                            _area(bboxes[0])) -
+                           (_enlarged_area(bboxes[1], boxes[i]) -
+                            _area(bboxes[1])))
+                if diff > max_diff:
+                    max_diff = diff
                     index = i
+        if _split_assign(boxes, index, groups, bboxes, sizes, minentries):
+            break
+    return groups == 1
 
-    return index
 
+@nb.njit(nogil=True, cache=True)
+def _split_linear(boxes, minentries):
+    """
+    Guttman linear split: return which 'boxes' go to the second group
 
-def splice(items, index, num_items):
-    removed_items = list()
-    for i in range(num_items):
-        item = items.pop(index)
-        removed_items.append(item)
-    return removed_items
+    Seeds are the two boxes farthest apart (normalized by the extent of
+    all of them) along either axis; the other boxes follow in order.
+    """
+    M = len(boxes)
+    seed1, seed2 = 0, 1
+    max_separation = -np.inf
+    for axis in range(2):
+        # box with the highest low side, box with the lowest high side
+        high = np.argmax(boxes[:, axis])
+        low = np.argmin(boxes[:, axis + 2])
+        if high == low:
+            low = 1 if high == 0 else 0
+            for i in range(M):
+                if i != high and boxes[i, axis + 2] < boxes[low, axis + 2]:
+                    low = i
+        width = boxes[:, axis + 2].max() - boxes[:, axis].min()
+        separation = boxes[high, axis] - boxes[low, axis + 2]
+        if width > 0:
+            separation /= width
+        if separation > max_separation:
+            max_separation = separation
+            seed1, seed2 = low, high
+
+    groups, bboxes, sizes = _split_seeds(boxes, seed1, seed2)
+    for i in range(M):
+        if groups[i] < 0:
+            if _split_assign(boxes, i, groups, bboxes, sizes, minentries):
+                break
+    return groups == 1
+
+
+@nb.njit(nogil=True, cache=True)
+def _split_seeds(boxes, seed1, seed2):
+    groups = np.full(len(boxes), -1, np.int64)
+    groups[seed1] = 0
+    groups[seed2] = 1
+    bboxes = np.empty((2, 4))
+    bboxes[0] = boxes[seed1]
+    bboxes[1] = boxes[seed2]
+    sizes = np.ones(2, np.int64)
+    return groups, bboxes, sizes
+
+
+@nb.njit(nogil=True, cache=True)
+def _split_assign(boxes, index, groups, bboxes, sizes, minentries):
+    """
+    Add box 'index' to the group needing the least enlargement (then the
+    smallest, then the one with fewer boxes). Once a group needs all the
+    remaining boxes to reach 'minentries', assign them all and return True
+    """
+    left = len(boxes) - sizes[0] - sizes[1]
+    for group in range(2):
+        if sizes[group] + left <= minentries:
+            for i in range(len(boxes)):
+                if groups[i] < 0:
+                    groups[i] = group
+                    sizes[group] += 1
+            return True
+
+    area0 = _area(bboxes[0])
+    area1 = _area(bboxes[1])
+    diff = ((_enlarged_area(bboxes[0], boxes[index]) - area0) -
+            (_enlarged_area(bboxes[1], boxes[index]) - area1))
+    if diff == 0:
+        diff = area0 - area1
+    if diff == 0:
+        diff = sizes[0] - sizes[1]
+    group = 1 if diff > 0 else 0
+    groups[index] = group
+    sizes[group] += 1
+    _union_row(bboxes, group, bboxes[group], boxes[index])
+    return False
+
+
+@nb.njit(nogil=True, cache=True)
+def _area(bbox):
+    return (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+
+
+@nb.njit(nogil=True, cache=True)
+def _enlarged_area(a, b):
+    return ((max(a[2], b[2]) - min(a[0], b[0])) *
+            (max(a[3], b[3]) - min(a[1], b[1])))
 
 
 def calc_intersection_area(a, b):
@@ -282,11 +599,35 @@ def contains(bbox, node):
     return bbox_lower_node and bbox_upper_node
 
 
+def equals(bbox, node):
+    """
+    Return True if 'bbox' and 'node' have the same borders
+    """
+    return (bbox[0] == xminf(node) and bbox[1] == yminf(node) and
+            bbox[2] == xmaxf(node) and bbox[3] == ymaxf(node))
+
+
 def intersects(bbox, node):
     node_lower_bbox = xminf(node) <= bbox[2] and yminf(node) <= bbox[3]
     node_upper_bbox = xmaxf(node) >= bbox[0] and ymaxf(node) >= bbox[1]
     return node_lower_bbox and node_upper_bbox
 
 
+def calc_point_dist(node, x, y):
+    """
+    Return the distance between point 'x,y' and 'node' box
+    """
+    dx = dy = 0
+    if x < xminf(node):
+        dx = xminf(node) - x
+    elif x > xmaxf(node):
+        dx = x - xmaxf(node)
+    if y < yminf(node):
+        dy = yminf(node) - y
+    elif y > ymaxf(node):
+        dy = y - ymaxf(node)
+    return (dx * dx + dy * dy) ** 0.5
+
+
 def calc_bbox_area(a):
     return (xmaxf(a) - xminf(a)) * (ymaxf(a) - yminf(a))
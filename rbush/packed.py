@@ -0,0 +1,998 @@
+"""
+Packed (array-backed) R-tree
+
+A packed tree lays out the whole tree in a few contiguous numpy arrays
+instead of nested node tuples:
+
+ - bboxes      : (n_nodes, 4) float64, nodes bounding-boxes
+ - offsets     : (n_nodes,) int64, position of the first child of each node
+ - counts      : (n_nodes,) int64, number of children of each node
+ - heights     : (n_nodes,) int64, height of each node (leaves are 1)
+ - sizes       : (n_nodes,) int64, number of items under each node
+ - items       : (N,) int64, leaf entries ids (indexes into the loaded array)
+ - item_bboxes : (N, 4) array, leaf entries bounding-boxes (leaf order)
+ - data        : None or (N,) array, leaf entries data (leaf order)
+
+Node '0' is the root.  Children of a node are contiguous: for internal nodes
+they are the nodes 'offsets[i]:offsets[i]+counts[i]', for leaves they are
+the entries 'offsets[i]:offsets[i]+counts[i]' of 'items'/'item_bboxes'.
+"""
+import heapq
+import math
+import threading
+from collections import deque, namedtuple
+from contextlib import contextmanager
+
+import numba as nb
+import numpy as np
+
+from ._python import create_node, create_item
+from .node import xminf, yminf, xmaxf, ymaxf, leaff, childrenf, heightf
+
+
+# bulk load methods (see 'pack')
+METHODS = ('omt', 'hilbert')
+
+PackedTree = namedtuple('PackedTree', ['bboxes', 'offsets', 'counts',
+                                       'heights', 'sizes', 'items',
+                                       'item_bboxes', 'data'])
+
+
+# types of items data stored as numpy arrays (see 'data_array')
+_SCALARS = (np.generic, bool, int, float, complex, str, bytes)
+
+
+class _Layout(object):
+    """
+    Growable lists of nodes attributes, used while packing
+    """
+    def __init__(self):
+        self.bboxes = []
+        self.offsets = []
+        self.counts = []
+        self.heights = []
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def allocate(self, num_nodes):
+        """
+        Reserve 'num_nodes' contiguous nodes, return the first one
+        """
+        first = len(self)
+        self.bboxes.extend([None] * num_nodes)
+        self.offsets.extend([0] * num_nodes)
+        self.counts.extend([0] * num_nodes)
+        self.heights.extend([0] * num_nodes)
+        return first
+
+
+def pack(arr, maxentries, data=None, ids=None, method='omt', workers=1):
+    """
+    Bulk load 'arr' items into a PackedTree
+
+    'arr' is expected to be a numerical array of (N,4) dimensions,
+    'data' and 'ids' (if given) arrays of N elements.  Items ids default
+    to their position in 'arr', which is not modified.
+
+    'method' is either 'omt' (see 'pack_omt') or 'hilbert' (see
+    'pack_hilbert').
+    """
+    if method == 'omt':
+        return pack_omt(arr, maxentries, data, ids, workers=workers)
+    if method == 'hilbert':
+        return pack_hilbert(arr, maxentries, data, ids)
+    msg = "Error: unknown bulk load method '{}'".format(method)
+    raise ValueError(msg)
+
+
+def pack_omt(arr, maxentries, data=None, ids=None, workers=1):
+    """
+    Bulk load 'arr' items into a PackedTree using the OMT algorithm
+
+    The tree is built one level at a time over index arrays only: items
+    are sorted once by 'xmin' and once by 'ymin', and every level then
+    splits those orders (stable, linear time) between the nodes children.
+    Nodes of a level being independent, they are split across 'workers'
+    threads ('-1' meaning all available cores).
+    """
+    boxes = np.asarray(arr)[:, :4]
+    N = len(boxes)
+    M = maxentries
+
+    # items of each node to split, sorted by 'xmin' and by 'ymin'
+    xorder, yorder = _argsort_columns(boxes, workers)
+    # items in leaf order, and scratch space to tag items with their tile
+    perm = np.empty(N, dtype=np.int64)
+    tags = np.empty(N, dtype=np.int64)
+
+    if N <= M:
+        height = 1
+        tiles = M
+    else:
+        # target height of the bulk-loaded tree
+        height = int(math.ceil(math.log(N) / math.log(M)))
+        # target number of root entries to maximize storage utilization
+        tiles = int(math.ceil(N / math.pow(M, height - 1)))
+
+    firsts = np.zeros(1, dtype=np.int64)
+    lasts = np.full(1, N - 1, dtype=np.int64)
+    heights = np.full(1, height, dtype=np.int64)
+    levels = list()
+    while len(firsts):
+        num_children = _count_children(firsts, lasts, tiles, M)
+        child_offsets = np.cumsum(num_children) - num_children
+        next_firsts = np.empty(num_children.sum(), dtype=np.int64)
+        next_lasts = np.empty(num_children.sum(), dtype=np.int64)
+        if workers == 1 or len(firsts) == 1:
+            _split_level(xorder, yorder, perm, tags, firsts, lasts, tiles, M,
+                         child_offsets, next_firsts, next_lasts)
+        else:
+            with num_threads(workers):
+                _split_level_parallel(xorder, yorder, perm, tags, firsts,
+                                      lasts, tiles, M, child_offsets,
+                                      next_firsts, next_lasts)
+
+        heights[num_children == 0] = 1
+        levels.append((firsts, lasts, heights, num_children, child_offsets))
+        heights = np.repeat(heights - 1, num_children)
+        firsts = next_firsts
+        lasts = next_lasts
+        tiles = M
+
+    item_bboxes = boxes[perm]
+    bboxes, offsets, counts, heights = _assemble(levels, item_bboxes)
+    if data is not None:
+        data = np.asarray(data)[perm]
+    if ids is not None:
+        perm = np.asarray(ids, dtype=np.int64)[perm]
+
+    return PackedTree(bboxes=bboxes,
+                      offsets=offsets,
+                      counts=counts,
+                      heights=heights,
+                      sizes=_subtree_sizes(offsets, counts, heights),
+                      items=perm,
+                      item_bboxes=item_bboxes,
+                      data=data)
+
+
+def pack_hilbert(arr, maxentries, data=None, ids=None):
+    """
+    Bulk load 'arr' items into a PackedTree sorted along a Hilbert curve
+
+    Items are sorted by the Hilbert index of their centres, then packed in
+    full nodes from the leaves up to the root.  'arr', 'data' and 'ids'
+    are as in 'pack'.
+    """
+    boxes = np.asarray(arr)[:, :4]
+    N = len(boxes)
+    M = maxentries
+
+    perm = np.argsort(hilbert_index(boxes))
+    item_bboxes = boxes[perm]
+
+    # number of nodes of each level, from the root down to the leaves
+    level_sizes = [(N + M - 1) // M]
+    while level_sizes[0] > 1:
+        level_sizes.insert(0, (level_sizes[0] + M - 1) // M)
+    starts = np.cumsum([0] + level_sizes)
+    num_entries = level_sizes[1:] + [N]
+
+    offsets = list()
+    counts = list()
+    for level, size in enumerate(level_sizes):
+        first = np.arange(size, dtype=np.int64) * M
+        counts.append(np.minimum(M, num_entries[level] - first))
+        if level < len(level_sizes) - 1:
+            first += starts[level + 1]
+        offsets.append(first)
+    offsets = np.concatenate(offsets)
+    counts = np.concatenate(counts)
+    heights = np.repeat(np.arange(len(level_sizes), 0, -1), level_sizes)
+
+    bboxes = np.empty((starts[-1], 4), dtype=np.float64)
+    children = item_bboxes
+    for level in range(len(level_sizes) - 1, -1, -1):
+        nodes = slice(starts[level], starts[level + 1])
+        first_children = np.arange(0, len(children), M)
+        bboxes[nodes] = _reduce_bboxes(children, first_children)
+        children = bboxes[nodes]
+
+    if data is not None:
+        data = np.asarray(data)[perm]
+    if ids is not None:
+        perm = np.asarray(ids, dtype=np.int64)[perm]
+
+    heights = heights.astype(np.int64)
+    return PackedTree(bboxes=bboxes,
+                      offsets=offsets,
+                      counts=counts,
+                      heights=heights,
+                      sizes=_subtree_sizes(offsets, counts, heights),
+                      items=perm,
+                      item_bboxes=item_bboxes,
+                      data=data)
+
+
+def hilbert_index(boxes):
+    """
+    Return the Hilbert curve index of 'boxes' centres
+
+    Centres are scaled to a 2**16 x 2**16 grid over the boxes extent (the
+    16 bits coordinates of '_hilbert').
+    """
+    hmax = (1 << 16) - 1
+    xmin = boxes[:, 0].min()
+    ymin = boxes[:, 1].min()
+    width = float(boxes[:, 2].max() - xmin) or 1.0
+    height = float(boxes[:, 3].max() - ymin) or 1.0
+    x = hmax * ((boxes[:, 0] + boxes[:, 2]) / 2.0 - xmin) / width
+    y = hmax * ((boxes[:, 1] + boxes[:, 3]) / 2.0 - ymin) / height
+    x = np.clip(x, 0, hmax).astype(np.uint32)
+    y = np.clip(y, 0, hmax).astype(np.uint32)
+    return _hilbert(x, y)
+
+
+def _hilbert(x, y):
+    """
+    Return the Hilbert index of 16 bits integer coordinates 'x,y'
+
+    Branch-free (thus vectorized) version of the Hilbert curve mapping from
+    "Fast Hilbert curve generation, sorting and range queries"
+    (https://github.com/rawrunprotected/hilbert_curves).
+    """
+    a = x ^ y
+    b = 0xFFFF ^ a
+    c = 0xFFFF ^ (x | y)
+    d = x & (y ^ 0xFFFF)
+
+    A = a | (b >> 1)
+    B = (a >> 1) ^ a
+    C = ((c >> 1) ^ (b & (d >> 1))) ^ c
+    D = ((a & (c >> 1)) ^ (d >> 1)) ^ d
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 2)) ^ (b & (b >> 2))
+    B = (a & (b >> 2)) ^ (b & ((a ^ b) >> 2))
+    C ^= (a & (c >> 2)) ^ (b & (d >> 2))
+    D ^= (b & (c >> 2)) ^ ((a ^ b) & (d >> 2))
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 4)) ^ (b & (b >> 4))
+    B = (a & (b >> 4)) ^ (b & ((a ^ b) >> 4))
+    C ^= (a & (c >> 4)) ^ (b & (d >> 4))
+    D ^= (b & (c >> 4)) ^ ((a ^ b) & (d >> 4))
+
+    a, b, c, d = A, B, C, D
+    C ^= (a & (c >> 8)) ^ (b & (d >> 8))
+    D ^= (b & (c >> 8)) ^ ((a ^ b) & (d >> 8))
+
+    a = C ^ (C >> 1)
+    b = D ^ (D >> 1)
+
+    i0 = x ^ y
+    i1 = b | (0xFFFF ^ (i0 | a))
+
+    i0 = (i0 | (i0 << 8)) & 0x00FF00FF
+    i0 = (i0 | (i0 << 4)) & 0x0F0F0F0F
+    i0 = (i0 | (i0 << 2)) & 0x33333333
+    i0 = (i0 | (i0 << 1)) & 0x55555555
+
+    i1 = (i1 | (i1 << 8)) & 0x00FF00FF
+    i1 = (i1 | (i1 << 4)) & 0x0F0F0F0F
+    i1 = (i1 | (i1 << 2)) & 0x33333333
+    i1 = (i1 | (i1 << 1)) & 0x55555555
+
+    return (i1 << 1) | i0
+
+
+def _argsort_columns(boxes, workers):
+    """
+    Return the items sorted by 'xmin' and by 'ymin'
+    """
+    if workers == 1:
+        return np.argsort(boxes[:, 0]), np.argsort(boxes[:, 1])
+    # numpy releases the GIL while sorting
+    orders = [None]
+    thread = threading.Thread(
+        target=lambda: orders.__setitem__(0, np.argsort(boxes[:, 1])))
+    thread.start()
+    xorder = np.argsort(boxes[:, 0])
+    thread.join()
+    return xorder, orders[0]
+
+
+def _assemble(levels, item_bboxes):
+    """
+    Return nodes bboxes/offsets/counts/heights, laid out level by level
+    """
+    level_sizes = [len(firsts) for firsts, _, _, _, _ in levels]
+    starts = np.cumsum([0] + level_sizes)
+
+    offsets = list()
+    counts = list()
+    leaves = list()
+    for level, (firsts, lasts, _, num_children, child_offsets) in \
+            enumerate(levels):
+        leaf = num_children == 0
+        offsets.append(np.where(leaf, firsts,
+                                starts[level + 1] + child_offsets))
+        counts.append(np.where(leaf, lasts - firsts + 1, num_children))
+        leaves.append(np.flatnonzero(leaf) + starts[level])
+    offsets = np.concatenate(offsets)
+    counts = np.concatenate(counts)
+    heights = np.concatenate([heights for _, _, heights, _, _ in levels])
+
+    bboxes = np.empty((starts[-1], 4), dtype=np.float64)
+    # leaves cover all items, each one a contiguous range of them
+    leaves = np.concatenate(leaves)
+    leaves = leaves[np.argsort(offsets[leaves])]
+    bboxes[leaves] = _reduce_bboxes(item_bboxes, offsets[leaves])
+    # each level internal nodes cover all nodes of the next level
+    for level in range(len(levels) - 2, -1, -1):
+        nodes = np.arange(starts[level], starts[level + 1])
+        nodes = nodes[heights[nodes] > 1]
+        children = bboxes[starts[level + 1]:starts[level + 2]]
+        bboxes[nodes] = _reduce_bboxes(children,
+                                       offsets[nodes] - starts[level + 1])
+    return bboxes, offsets, counts, heights
+
+
+@nb.njit(nogil=True, cache=True)
+def _subtree_sizes(offsets, counts, heights):
+    """
+    Return the number of items under each node
+    """
+    sizes = counts.copy()
+    # children come after their parent in the layout
+    for node in range(len(offsets) - 1, -1, -1):
+        if heights[node] > 1:
+            first = offsets[node]
+            sizes[node] = sizes[first:first + counts[node]].sum()
+    return sizes
+
+
+def _reduce_bboxes(bboxes, starts):
+    """
+    Return the bboxes enclosing 'bboxes[starts[i]:starts[i+1]]'
+    """
+    reduced = np.empty((len(starts), 4), dtype=np.float64)
+    if len(starts):
+        reduced[:, 0] = np.minimum.reduceat(bboxes[:, 0], starts)
+        reduced[:, 1] = np.minimum.reduceat(bboxes[:, 1], starts)
+        reduced[:, 2] = np.maximum.reduceat(bboxes[:, 2], starts)
+        reduced[:, 3] = np.maximum.reduceat(bboxes[:, 3], starts)
+    return reduced
+
+
+@nb.njit(nogil=True, cache=True)
+def _tiles(num_items, num_tiles):
+    """
+    Return the sizes of slices and tiles splitting items in mostly square tiles
+    """
+    tile_size = (num_items + num_tiles - 1) // num_tiles
+    slice_size = tile_size * int(math.ceil(math.sqrt(num_tiles)))
+    return slice_size, tile_size
+
+
+@nb.njit(nogil=True, cache=True)
+def _count_children(firsts, lasts, num_tiles, maxentries):
+    num_children = np.zeros(len(firsts), dtype=np.int64)
+    for n in range(len(firsts)):
+        num_items = lasts[n] - firsts[n] + 1
+        if num_items <= maxentries:
+            continue
+        slice_size, tile_size = _tiles(num_items, num_tiles)
+        for i in range(0, num_items, slice_size):
+            size = min(slice_size, num_items - i)
+            num_children[n] += (size + tile_size - 1) // tile_size
+    return num_children
+
+
+@nb.njit(nogil=True, cache=True)
+def _split_level(xorder, yorder, perm, tags, firsts, lasts, num_tiles,
+                 maxentries, child_offsets, child_firsts, child_lasts):
+    for n in range(len(firsts)):
+        _split_node(xorder, yorder, perm, tags, firsts[n], lasts[n],
+                    num_tiles, maxentries, child_offsets[n],
+                    child_firsts, child_lasts)
+
+
+@nb.njit(nogil=True, parallel=True, cache=True)
+def _split_level_parallel(xorder, yorder, perm, tags, firsts, lasts,
+                          num_tiles, maxentries, child_offsets,
+                          child_firsts, child_lasts):
+    # nodes own disjoint ranges of items, and of children
+    for n in nb.prange(len(firsts)):
+        _split_node(xorder, yorder, perm, tags, firsts[n], lasts[n],
+                    num_tiles, maxentries, child_offsets[n],
+                    child_firsts, child_lasts)
+
+
+@nb.njit(nogil=True, cache=True)
+def _split_node(xorder, yorder, perm, tags, first, last, num_tiles,
+                maxentries, child_offset, child_firsts, child_lasts):
+    """
+    Split items 'first:last+1' between the node children (OMT)
+
+    On input 'xorder'/'yorder' hold the node items sorted by 'xmin'/'ymin'.
+    Items are split in vertical slices by 'xmin', then each slice in tiles
+    by 'ymin', the tiles being the children.  On output 'perm' holds the
+    items by child and 'xorder'/'yorder' the items of each child sorted.
+    """
+    num_items = last - first + 1
+    if num_items <= maxentries:
+        # leaf, nothing left to sort
+        perm[first:last+1] = xorder[first:last+1]
+        return
+
+    slice_size, tile_size = _tiles(num_items, num_tiles)
+
+    # slices by 'xmin', each one sorted by 'ymin'
+    num_slices = (num_items + slice_size - 1) // slice_size
+    for i in range(num_items):
+        tags[xorder[first + i]] = i // slice_size
+    filled = np.zeros(num_slices, dtype=np.int64)
+    for i in range(first, last + 1):
+        item = yorder[i]
+        tag = tags[item]
+        perm[first + tag * slice_size + filled[tag]] = item
+        filled[tag] += 1
+    yorder[first:last+1] = perm[first:last+1]
+
+    # tiles of each slice are the node children
+    child = 0
+    for i in range(0, num_items, slice_size):
+        slice_last = min(i + slice_size, num_items) - 1
+        for j in range(i, slice_last + 1, tile_size):
+            child_last = min(j + tile_size - 1, slice_last)
+            child_firsts[child_offset + child] = first + j
+            child_lasts[child_offset + child] = first + child_last
+            for k in range(j, child_last + 1):
+                tags[perm[first + k]] = child
+            child += 1
+
+    # stable split of the items sorted by 'xmin' between children
+    sorted_x = xorder[first:last+1].copy()
+    filled = np.zeros(child, dtype=np.int64)
+    for i in range(num_items):
+        item = sorted_x[i]
+        tag = tags[item]
+        xorder[child_firsts[child_offset + tag] + filled[tag]] = item
+        filled[tag] += 1
+
+
+def pack_tree(root):
+    """
+    Return the PackedTree equivalent of a (nested) node tree
+
+    Nodes are laid out level by level, as 'pack' does, and items in
+    depth-first order so the items of any node are contiguous.
+    """
+    entries = list()
+    item_offsets = dict()
+    collect_items(root, entries, item_offsets)
+
+    layout = _Layout()
+    layout.allocate(1)
+    queue = deque([root])
+    index = 0
+    while len(queue):
+        node = queue.popleft()
+        layout.bboxes[index] = (xminf(node), yminf(node),
+                                xmaxf(node), ymaxf(node))
+        layout.counts[index] = len(childrenf(node))
+        layout.heights[index] = heightf(node)
+        if leaff(node):
+            layout.offsets[index] = item_offsets[id(node)]
+        else:
+            # children are allocated together, to keep them contiguous
+            layout.offsets[index] = layout.allocate(len(childrenf(node)))
+            queue.extend(childrenf(node))
+        index += 1
+
+    bboxes = np.asarray([bbox for bbox, _, _ in entries], dtype=np.float64)
+    data = [data for _, data, _ in entries]
+    if all(d is None for d in data):
+        data = None
+    else:
+        data = data_array(data)
+    ids = [-1 if item_id is None else item_id for _, _, item_id in entries]
+
+    offsets = np.array(layout.offsets, dtype=np.int64)
+    counts = np.array(layout.counts, dtype=np.int64)
+    heights = np.array(layout.heights, dtype=np.int64)
+    return PackedTree(bboxes=np.array(layout.bboxes, dtype=np.float64),
+                      offsets=offsets,
+                      counts=counts,
+                      heights=heights,
+                      sizes=_subtree_sizes(offsets, counts, heights),
+                      items=np.array(ids, dtype=np.int64),
+                      item_bboxes=bboxes.reshape(-1, 4),
+                      data=data)
+
+
+def data_array(values):
+    """
+    Return the array of items data 'values' (a list)
+
+    Values that are all numbers (or all strings) of one kind, as numpy
+    scalars or python ones, are stored as a numpy array of that kind.
+    Others are kept as they are, in an array of python objects: the array
+    of mixed values (e.g. '1' and 'a') would convert them to a common type.
+    """
+    kinds = {}
+    for value in values:
+        kind = type(value)
+        if kind not in kinds:
+            if issubclass(kind, _SCALARS):
+                kinds[kind] = np.dtype(kind).kind
+            else:
+                kinds[kind] = 'O'
+    kinds = set(kinds.values())
+    if len(kinds) == 1 and 'O' not in kinds:
+        try:
+            arr = np.asarray(values)
+        except (ValueError, OverflowError):
+            arr = None
+        if arr is not None and arr.dtype.kind in kinds:
+            return arr
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+
+def collect_items(node, entries, item_offsets):
+    """
+    Append 'node' leaf items to 'entries', depth-first, recording the
+    position of each leaf first item in 'item_offsets'
+    """
+    if leaff(node):
+        item_offsets[id(node)] = len(entries)
+        entries.extend(childrenf(node))
+        return
+    for child in childrenf(node):
+        collect_items(child, entries, item_offsets)
+
+
+def search(packed, xmin, ymin, xmax, ymax, dead=None):
+    """
+    Return positions (in leaf order) of entries intersecting the bbox
+
+    'dead', if given, is a boolean array flagging (by item id) the items
+    to leave out (see 'RBush.discard'); all query functions take it.
+    """
+    return _search(packed.bboxes, packed.offsets, packed.counts,
+                   packed.heights, packed.item_bboxes, packed.items,
+                   _dead(dead), xmin, ymin, xmax, ymax)
+
+
+def search_many(packed, queries, workers=1, dead=None):
+    """
+    Return positions (in leaf order) of entries intersecting each query
+
+    'queries' is a (Q,4) array of bboxes.  Output is in CSR format: matches
+    of query 'i' are 'positions[offsets[i]:offsets[i+1]]'.
+
+    With 'workers' other than 1, queries are split across that many threads
+    ('-1' meaning all available cores).
+    """
+    queries = np.asarray(queries, dtype=np.float64)
+    args = (packed.bboxes, packed.offsets, packed.counts,
+            packed.heights, packed.item_bboxes, packed.items, _dead(dead),
+            queries)
+    if workers == 1:
+        return _search_many(*args)
+    with num_threads(workers):
+        return _search_many_parallel(*args, 4 * nb.get_num_threads())
+
+
+@contextmanager
+def num_threads(workers):
+    """
+    Set the number of threads used by parallel kernels within the context
+    """
+    previous = nb.get_num_threads()
+    if workers is None or workers < 1:
+        workers = nb.config.NUMBA_NUM_THREADS
+    nb.set_num_threads(min(workers, nb.config.NUMBA_NUM_THREADS))
+    try:
+        yield
+    finally:
+        nb.set_num_threads(previous)
+
+
+def count(packed, xmin, ymin, xmax, ymax, dead=None):
+    """
+    Return the number of entries intersecting the bbox
+    """
+    return _count(packed.bboxes, packed.offsets, packed.counts,
+                  packed.heights, packed.sizes, packed.item_bboxes,
+                  packed.items, _dead(dead), xmin, ymin, xmax, ymax, False)
+
+
+def collides(packed, xmin, ymin, xmax, ymax, dead=None):
+    """
+    Return True if any entry intersects the bbox
+    """
+    return _count(packed.bboxes, packed.offsets, packed.counts,
+                  packed.heights, packed.sizes, packed.item_bboxes,
+                  packed.items, _dead(dead), xmin, ymin, xmax, ymax,
+                  True) > 0
+
+
+def knn(packed, x, y, k, max_distance=None, dead=None):
+    """
+    Return positions and distances of the 'k' entries nearest to 'x,y'
+
+    Entries farther than 'max_distance' (if given) are left out, so fewer
+    than 'k' may be returned.  Entries are sorted by distance.
+    """
+    if max_distance is None:
+        max_distance = np.inf
+    return _knn(packed.bboxes, packed.offsets, packed.counts, packed.heights,
+                packed.item_bboxes, packed.items, _dead(dead),
+                float(x), float(y), k, float(max_distance))
+
+
+def knn_many(packed, points, k, max_distance=None, workers=1, dead=None):
+    """
+    Return positions and distances of the 'k' entries nearest to each point
+
+    'points' is a (Q,2) array.  Output are two (Q,k) arrays, rows padded
+    with position '-1' and distance 'inf' when less than 'k' entries are
+    found (see 'knn').  With 'workers' other than 1, points are split
+    across that many threads ('-1' meaning all available cores).
+    """
+    if max_distance is None:
+        max_distance = np.inf
+    points = np.asarray(points, dtype=np.float64)
+    args = (packed.bboxes, packed.offsets, packed.counts, packed.heights,
+            packed.item_bboxes, packed.items, _dead(dead), points, k,
+            float(max_distance))
+    if workers == 1:
+        return _knn_many(*args)
+    with num_threads(workers):
+        return _knn_many_parallel(*args)
+
+
+_NO_DEAD = np.zeros(0, dtype=np.bool_)
+
+
+def _dead(dead):
+    if dead is None:
+        return _NO_DEAD
+    return dead
+
+
+@nb.njit(nogil=True, cache=True)
+def _alive(items, dead, i):
+    """
+    Return False if the entry at position 'i' is flagged in 'dead'
+    """
+    item = items[i]
+    return item < 0 or item >= len(dead) or not dead[item]
+
+
+@nb.njit(nogil=True, cache=True)
+def _box_dist2(bboxes, i, x, y):
+    """
+    Return the squared distance between 'x,y' and the bbox 'i'
+    """
+    dx = max(bboxes[i, 0] - x, 0.0, x - bboxes[i, 2])
+    dy = max(bboxes[i, 1] - y, 0.0, y - bboxes[i, 3])
+    return dx * dx + dy * dy
+
+
+@nb.njit(nogil=True, cache=True)
+def _knn(bboxes, offsets, counts, heights, item_bboxes, items, dead,
+         x, y, k, max_distance):
+    found = np.empty(max(k, 0), dtype=np.int64)
+    distances = np.empty(max(k, 0), dtype=np.float64)
+    num_found = 0
+    max_dist2 = max_distance * max_distance
+
+    # best-first: queue (squared distance, position, is an entry) of nodes
+    # and entries, the nearest being popped first
+    queue = [(_box_dist2(bboxes, 0, x, y), 0, 0)]
+    while len(queue) and num_found < k:
+        dist2, index, is_entry = heapq.heappop(queue)
+        if dist2 > max_dist2:
+            break
+        if is_entry:
+            found[num_found] = index
+            distances[num_found] = math.sqrt(dist2)
+            num_found += 1
+            continue
+        first = offsets[index]
+        last = first + counts[index]
+        if heights[index] == 1:
+            for i in range(first, last):
+                dist2 = _box_dist2(item_bboxes, i, x, y)
+                if dist2 <= max_dist2 and _alive(items, dead, i):
+                    heapq.heappush(queue, (dist2, i, 1))
+        else:
+            for i in range(first, last):
+                dist2 = _box_dist2(bboxes, i, x, y)
+                if dist2 <= max_dist2:
+                    heapq.heappush(queue, (dist2, i, 0))
+    return found[:num_found], distances[:num_found]
+
+
+@nb.njit(nogil=True, cache=True)
+def _knn_point(bboxes, offsets, counts, heights, item_bboxes, items, dead,
+               points, q, k, max_distance, found, distances):
+    """
+    Fill row 'q' of 'found'/'distances' with the entries nearest to point 'q'
+    """
+    row_found, row_distances = _knn(bboxes, offsets, counts, heights,
+                                    item_bboxes, items, dead,
+                                    points[q, 0], points[q, 1],
+                                    k, max_distance)
+    num_found = len(row_found)
+    found[q, :num_found] = row_found
+    distances[q, :num_found] = row_distances
+    found[q, num_found:] = -1
+    distances[q, num_found:] = np.inf
+
+
+@nb.njit(nogil=True, cache=True)
+def _knn_many(bboxes, offsets, counts, heights, item_bboxes, items, dead,
+              points, k, max_distance):
+    found = np.empty((len(points), k), dtype=np.int64)
+    distances = np.empty((len(points), k), dtype=np.float64)
+    for q in range(len(points)):
+        _knn_point(bboxes, offsets, counts, heights, item_bboxes, items,
+                   dead, points, q, k, max_distance, found, distances)
+    return found, distances
+
+
+@nb.njit(nogil=True, parallel=True, cache=True)
+def _knn_many_parallel(bboxes, offsets, counts, heights, item_bboxes, items,
+                       dead, points, k, max_distance):
+    found = np.empty((len(points), k), dtype=np.int64)
+    distances = np.empty((len(points), k), dtype=np.float64)
+    for q in nb.prange(len(points)):
+        _knn_point(bboxes, offsets, counts, heights, item_bboxes, items,
+                   dead, points, q, k, max_distance, found, distances)
+    return found, distances
+
+
+@nb.njit(nogil=True, cache=True)
+def _contains(xmin, ymin, xmax, ymax, bboxes, i):
+    return (xmin <= bboxes[i, 0] and ymin <= bboxes[i, 1] and
+            bboxes[i, 2] <= xmax and bboxes[i, 3] <= ymax)
+
+
+@nb.njit(nogil=True, cache=True)
+def _intersects(bboxes, i, xmin, ymin, xmax, ymax):
+    return (bboxes[i, 0] <= xmax and bboxes[i, 1] <= ymax and
+            bboxes[i, 2] >= xmin and bboxes[i, 3] >= ymin)
+
+
+@nb.njit(nogil=True, cache=True)
+def _search_node(bboxes, offsets, counts, heights, item_bboxes, items, dead,
+                 xmin, ymin, xmax, ymax, stack, found, num_found):
+    """
+    Append matching positions to 'found[num_found:]', growing it if needed
+
+    Return 'found' and the new number of positions in it.
+    """
+    if not _intersects(bboxes, 0, xmin, ymin, xmax, ymax):
+        return found, num_found
+    stack[0] = 0
+    size = 1
+    while size > 0:
+        size -= 1
+        node = stack[size]
+        first = offsets[node]
+        last = first + counts[node]
+        if heights[node] == 1:
+            # room for all the leaf entries, so that the (separate) loop
+            # over them does not have to grow 'found'
+            if num_found + last - first > len(found):
+                found = _grow(found, num_found + last - first)
+            num_found = _search_leaf(item_bboxes, items, dead, first, last,
+                                     xmin, ymin, xmax, ymax, found,
+                                     num_found)
+        else:
+            for i in range(last - 1, first - 1, -1):
+                if _intersects(bboxes, i, xmin, ymin, xmax, ymax):
+                    if size == len(stack):
+                        stack = _grow(stack, size + 1)
+                    stack[size] = i
+                    size += 1
+    return found, num_found
+
+
+@nb.njit(nogil=True, cache=True)
+def _search_leaf(item_bboxes, items, dead, first, last,
+                 xmin, ymin, xmax, ymax, found, num_found):
+    """
+    Store matching positions among 'first:last' entries from
+    'found[num_found]' on, return the new number of positions in 'found'
+    """
+    for i in range(first, last):
+        if (_intersects(item_bboxes, i, xmin, ymin, xmax, ymax) and
+                _alive(items, dead, i)):
+            found[num_found] = i
+            num_found += 1
+    return num_found
+
+
+@nb.njit(nogil=True, cache=True)
+def _scan_node(bboxes, offsets, counts, heights, item_bboxes, items, dead,
+               xmin, ymin, xmax, ymax, stack, found, start, store):
+    """
+    Return the number of matching positions, stored from 'found[start]' on
+    if 'store' (the output being preallocated, unlike in '_search_node')
+    """
+    if not _intersects(bboxes, 0, xmin, ymin, xmax, ymax):
+        return 0
+    num_found = 0
+    stack[0] = 0
+    size = 1
+    while size > 0:
+        size -= 1
+        node = stack[size]
+        first = offsets[node]
+        last = first + counts[node]
+        if heights[node] == 1:
+            for i in range(first, last):
+                if (_intersects(item_bboxes, i, xmin, ymin, xmax, ymax) and
+                        _alive(items, dead, i)):
+                    if store:
+                        found[start + num_found] = i
+                    num_found += 1
+        else:
+            for i in range(last - 1, first - 1, -1):
+                if _intersects(bboxes, i, xmin, ymin, xmax, ymax):
+                    if size == len(stack):
+                        stack = _grow(stack, size + 1)
+                    stack[size] = i
+                    size += 1
+    return num_found
+
+
+@nb.njit(nogil=True, cache=True)
+def _count(bboxes, offsets, counts, heights, sizes, item_bboxes, items, dead,
+           xmin, ymin, xmax, ymax, first_only):
+    """
+    Return the number of entries intersecting the bbox, stopping at the
+    first one if 'first_only'.  Nodes within the bbox are not walked
+    (unless some items are 'dead').
+    """
+    if not _intersects(bboxes, 0, xmin, ymin, xmax, ymax):
+        return 0
+    use_sizes = len(dead) == 0
+    if use_sizes and _contains(xmin, ymin, xmax, ymax, bboxes, 0):
+        return sizes[0]
+    num_found = 0
+    stack = _stack()
+    stack[0] = 0
+    size = 1
+    while size > 0:
+        size -= 1
+        node = stack[size]
+        first = offsets[node]
+        last = first + counts[node]
+        if heights[node] == 1:
+            for i in range(first, last):
+                if (_intersects(item_bboxes, i, xmin, ymin, xmax, ymax) and
+                        _alive(items, dead, i)):
+                    num_found += 1
+                    if first_only:
+                        return num_found
+        else:
+            for i in range(first, last):
+                if not _intersects(bboxes, i, xmin, ymin, xmax, ymax):
+                    continue
+                if use_sizes and _contains(xmin, ymin, xmax, ymax, bboxes, i):
+                    num_found += sizes[i]
+                    if first_only and num_found > 0:
+                        return num_found
+                else:
+                    if size == len(stack):
+                        stack = _grow(stack, size + 1)
+                    stack[size] = i
+                    size += 1
+    return num_found
+
+
+@nb.njit(nogil=True, cache=True)
+def _stack():
+    # nodes to visit, grown by '_grow' in the (rare) case it gets full
+    return np.empty(64, dtype=np.int64)
+
+
+@nb.njit(nogil=True, cache=True)
+def _grow(arr, size):
+    """
+    Return a copy of 'arr' with room for (at least) 'size' entries
+    """
+    grown = np.empty(max(size, 2 * len(arr)), dtype=np.int64)
+    grown[:len(arr)] = arr
+    return grown
+
+
+@nb.njit(nogil=True, cache=True)
+def _search(bboxes, offsets, counts, heights, item_bboxes, items, dead,
+            xmin, ymin, xmax, ymax):
+    found = np.empty(16, dtype=np.int64)
+    found, num_found = _search_node(bboxes, offsets, counts, heights,
+                                    item_bboxes, items, dead,
+                                    xmin, ymin, xmax, ymax,
+                                    _stack(), found, 0)
+    return found[:num_found].copy()
+
+
+@nb.njit(nogil=True, cache=True)
+def _search_many(bboxes, offsets, counts, heights, item_bboxes, items, dead,
+                 queries):
+    stack = _stack()
+    found = np.empty(max(16, len(queries)), dtype=np.int64)
+    num_found = 0
+    result_offsets = np.zeros(len(queries) + 1, dtype=np.int64)
+    for q in range(len(queries)):
+        found, num_found = _search_node(bboxes, offsets, counts, heights,
+                                        item_bboxes, items, dead,
+                                        queries[q, 0], queries[q, 1],
+                                        queries[q, 2], queries[q, 3],
+                                        stack, found, num_found)
+        result_offsets[q + 1] = num_found
+    return result_offsets, found[:num_found].copy()
+
+
+@nb.njit(nogil=True, parallel=True, cache=True)
+def _search_many_parallel(bboxes, offsets, counts, heights, item_bboxes,
+                          items, dead, queries, num_chunks):
+    # two passes: count matches of each query, then fill them in place.
+    # Queries are split in 'num_chunks' (a few per thread), each walked
+    # with its own stack
+    num_queries = len(queries)
+    num_chunks = min(num_queries, num_chunks)
+    result_counts = np.zeros(num_queries + 1, dtype=np.int64)
+    found = np.empty(0, dtype=np.int64)
+    for chunk in nb.prange(num_chunks):
+        stack = _stack()
+        for q in range(chunk * num_queries // num_chunks,
+                       (chunk + 1) * num_queries // num_chunks):
+            result_counts[q + 1] = _scan_node(bboxes, offsets, counts,
+                                              heights, item_bboxes, items,
+                                              dead, queries[q, 0],
+                                              queries[q, 1], queries[q, 2],
+                                              queries[q, 3], stack, found, 0,
+                                              False)
+    result_offsets = np.cumsum(result_counts)
+
+    found = np.empty(result_offsets[-1], dtype=np.int64)
+    for chunk in nb.prange(num_chunks):
+        stack = _stack()
+        for q in range(chunk * num_queries // num_chunks,
+                       (chunk + 1) * num_queries // num_chunks):
+            _scan_node(bboxes, offsets, counts, heights, item_bboxes, items,
+                       dead, queries[q, 0], queries[q, 1], queries[q, 2],
+                       queries[q, 3], stack, found, result_offsets[q], True)
+    return result_offsets, found
+
+
+def unpack(packed, index=0):
+    """
+    Return the (nested) node tree equivalent of node 'index' of 'packed'
+    """
+    first = packed.offsets[index]
+    last = first + packed.counts[index]
+    height = int(packed.heights[index])
+    children = list()
+    if height == 1:
+        for i in range(first, last):
+            data = None if packed.data is None else packed.data[i]
+            children.append(create_item(packed.item_bboxes[i], data,
+                                        packed.items[i]))
+    else:
+        for i in range(first, last):
+            children.append(unpack(packed, i))
+    bbox = tuple(packed.bboxes[index])
+    return create_node(bbox, children=children, leaf=height == 1,
+                       height=height)
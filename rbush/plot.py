@@ -3,6 +3,8 @@ from bokeh.models.glyphs import Rect
 from bokeh.io import curdoc, show
 from bokeh.plotting import figure
 
+import json
+
 from rbush.data import generate_data_array
 import rbush
 
@@ -24,7 +26,7 @@ t = rbush.RBush()
 t.load(data)
 
 items = []
-bboxes(rbush.to_dict(t._root), items)
+bboxes(json.loads(t.to_json()), items)
 items.sort(key=lambda l:-l[4])
 
 x,y,w,h,height = [],[],[],[],[]
@@ -10,21 +10,22 @@ def test_against_brute_force_numba():
     data = generate_data_array(100000,10)
     b.load(data)
 
+    ids = np.arange(len(data))
     search_box = (-1, -1, 1, 1)
 
-    c = search_brute_force(b.data, b.boxes, *search_box)
+    c = search_brute_force(ids, data, *search_box)
     t1 = time()
-    c = search_brute_force(b.data, b.boxes, *search_box)
-    c = search_brute_force(b.data, b.boxes, *search_box)
-    c = search_brute_force(b.data, b.boxes, *search_box)
+    c = search_brute_force(ids, data, *search_box)
+    c = search_brute_force(ids, data, *search_box)
+    c = search_brute_force(ids, data, *search_box)
     t2 = time()
     print('BRUTE FORCE;', len(c), 'time: {:.5f}'.format(t2 - t1))
 
-    c, d = b.search(*search_box)
+    c = b.search(*search_box, return_indices=True)
     rbush_t1 = time()
-    c, d = b.search(*search_box)
-    c, d = b.search(*search_box)
-    c, d = b.search(*search_box)
+    c = b.search(*search_box, return_indices=True)
+    c = b.search(*search_box, return_indices=True)
+    c = b.search(*search_box, return_indices=True)
     rbush_t2 = time()
     print('RBUSH;', len(c), 'time: {:.5f}'.format(rbush_t2 - rbush_t1))
     assert rbush_t2 - rbush_t1 < t2 - t1, 'Sorry not fast enough yet'
@@ -1,8 +1,18 @@
 import pytest
 import sys
+import os
+import pickle
+import threading
+import time
+import warnings
 import numpy as np
+import rbush.packed
+import rbush.tree
 from rbush import RBush
 from rbush import to_dict
+from rbush._lock import RWLock
+from rbush.node import calc_bbox_children
+from rbush.tests.test_packed import brute_force
 
 Infinity = sys.maxsize
 
@@ -64,6 +74,34 @@ def sorted_equal(bboxes, data):
     return np.array_equal(ad, ab)
 
 
+def check_tree(tree, minentries, maxentries):
+    """
+    Check that 'tree' is balanced, its nodes having 'minentries' to
+    'maxentries' children (but the root) and tight bboxes, and that its
+    cached children bboxes and its ids index follow its nodes
+    """
+    leaves = {}
+    nodes = [tree._root]
+    while nodes:
+        node = nodes.pop()
+        assert len(node.children) <= maxentries
+        if node is not tree._root:
+            assert len(node.children) >= minentries
+        assert list(node.bbox) == list(calc_bbox_children(node.children))
+        if node.leaf:
+            leaves.update((item.id, node) for item in node.children)
+            continue
+        if node.boxes is not None:
+            assert np.array_equal(node.boxes,
+                                  [child.bbox for child in node.children])
+        for child in node.children:
+            assert child.height == node.height - 1
+        nodes.extend(node.children)
+    assert len(tree._index) == len(leaves)
+    for item_id, leaf in leaves.items():
+        assert tree._index[item_id] is leaf
+
+
 # TESTS ======================================================================
 #
 def test_root_split():
@@ -94,6 +132,24 @@ def test_load():
     assert sorted_equal(data_array, items)
 
 
+def test_load_hilbert():
+    tree = RBush(4)
+    tree.load(data_array, method='hilbert')
+
+    items,_ = tree.all()
+    assert sorted_equal(data_array, items)
+
+    items,_ = tree.search(xmin=40, ymin=20, xmax=80, ymax=70)
+    assert len(items) == 12
+
+
+def test_load_method():
+    with pytest.raises(ValueError):
+        RBush(4).load(data_array[:2], method='foo')
+    with pytest.raises(ValueError):
+        RBush(4).load(data_array, method='foo')
+
+
 def test_load_insert():
     tree = RBush(8, 4)
     tree.load(data_array[:17])
@@ -108,6 +164,100 @@ def test_load_insert():
     assert tree.to_json() == tree2.to_json()
 
 
+@pytest.mark.parametrize('loaded', [0, 17])
+def test_insert_batch(loaded):
+    tree = RBush(4, 2)
+    if loaded:
+        tree.load(data_array[:loaded])
+    tree.insert(*data_array[loaded:].T, batch=True)
+
+    items, _ = tree.all()
+    assert sorted_equal(data_array, items)
+    ids = tree.search(40, 20, 80, 70, return_indices=True)
+    assert np.array_equal(np.sort(ids),
+                          brute_force(data_array, 40, 20, 80, 70))
+
+    # balanced tree of 'minentries' to 'maxentries' children with tight
+    # bboxes, even for large batches
+    np.random.seed(1)
+    data = np.random.random((2000, 2)) * 100
+    data = np.hstack([data, data + np.random.random((2000, 2))])
+    tree2 = RBush(4, 2)
+    tree2.insert(*data.T, batch=True)
+    check_tree(tree, 2, 4)
+    check_tree(tree2, 2, 4)
+
+
+def test_insert_rstar():
+    np.random.seed(1)
+    data = np.random.randint(0, 1000, (500, 2))
+    data = np.hstack([data, data + np.random.randint(0, 20, (500, 2))])
+    tree = RBush(6, 3, strategy='rstar')
+    tree.insert(*data.T)
+    for i in range(0, 500, 5):
+        tree.update(i, *(data[i] + 500))
+    data[::5] += 500
+
+    ids = tree.search(200, 200, 700, 700, return_indices=True)
+    assert np.array_equal(np.sort(ids), brute_force(data, 200, 200, 700, 700))
+    check_tree(tree, 3, 6)
+
+    with pytest.raises(ValueError):
+        RBush(strategy='rtree')
+
+
+@pytest.mark.parametrize('split', ['rstar', 'quadratic', 'linear'])
+def test_insert_split(split):
+    np.random.seed(2)
+    data = np.random.random((3000, 2)) * 1000
+    data = np.hstack([data, data + np.random.random((3000, 2)) * 20])
+    tree = RBush(64, 25, split=split)
+    tree.insert(*data.T)
+
+    ids = tree.search(200, 200, 700, 700, return_indices=True)
+    assert np.array_equal(np.sort(ids), brute_force(data, 200, 200, 700, 700))
+    check_tree(tree, 25, 64)
+
+    with pytest.raises(ValueError):
+        RBush(split='greene')
+
+
+def test_split_strategy_kept(monkeypatch):
+    # every modification splits nodes and chooses subtrees as set up
+    np.random.seed(4)
+    data = np.random.randint(0, 1000, (600, 2))
+    data = np.hstack([data, data + 10])
+    tree = RBush(6, 3, strategy='rstar', split='linear')
+    tree.insert(*data[:300].T)
+    splits = []
+    overlaps = []
+    split = rbush.tree.split
+    choose_subtree = rbush.tree.choose_subtree
+
+    def spy_split(node, minentries, method='rstar'):
+        splits.append(method)
+        return split(node, minentries, method)
+
+    def spy_choose_subtree(node, bbox, level, path, overlap=False,
+                           index=None):
+        overlaps.append(overlap)
+        return choose_subtree(node, bbox, level, path, overlap, index)
+    monkeypatch.setattr(rbush.tree, 'split', spy_split)
+    monkeypatch.setattr(rbush.tree, 'choose_subtree', spy_choose_subtree)
+
+    for i in range(0, 200, 2):
+        tree.remove(i)
+    for i in range(1, 200, 2):
+        tree.remove(*data[i])
+    moved = data[200:300] + 400
+    tree.update_many(np.arange(200, 300), *moved.T)
+    tree.load(data[300:])
+    assert splits and overlaps
+    assert set(splits) == {'linear'}
+    assert set(overlaps) == {True}
+    check_tree(tree, 3, 6)
+
+
 def test_data_load_empty():
     tree = RBush()
     with pytest.raises(ValueError):
@@ -195,12 +345,167 @@ def test_find_matching_bbox():
     assert sorted_equal(items, compare_data)
 
 
-# def test_find_empty_result():
-#     tree = RBush(4)
-#     tree.load(data_array)
-#
-#     result = tree.search(200, 200, 210, 210)
-#     assert result == []
+def test_knn():
+    tree1 = RBush(4)
+    tree1.load(data_array)
+    tree2 = RBush(4)
+    for i in range(len(data_array)):
+        tree2.insert(*data_array[i])
+
+    dist = np.hypot(data_array[:, 0] - 40, data_array[:, 1] - 40)
+    for tree in (tree1, tree2):
+        indices, distances = tree.knn(40, 40, 5)
+        assert len(indices) == 5
+        assert np.allclose(distances, np.sort(dist)[:5])
+        assert np.allclose(dist[indices], distances)
+
+        indices, distances = tree.knn(40, 40, 10, max_distance=10)
+        assert np.allclose(distances, np.sort(dist[dist <= 10]))
+
+        indices, distances = tree.knn(40, 40, 100)
+        assert len(indices) == len(data_array)
+
+
+def test_knn_empty():
+    tree = RBush(4)
+    tree.insert(*data_array[0])
+    tree.remove(*data_array[0])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        for tree in (RBush(4), tree):
+            indices, distances = tree.knn(40, 40, 3)
+            assert len(indices) == 0 and len(distances) == 0
+            assert len(rbush.tree.knn(tree._root, 40, 40, 3)) == 0
+
+
+def test_knn_many():
+    points = np.array([[40, 40], [0, 0], [200, 200]])
+    tree = RBush(4)
+    tree.load(data_array)
+    for workers in (1, -1):
+        indices, distances = tree.knn_many(points, 3, workers=workers)
+        assert indices.shape == distances.shape == (3, 3)
+        for i, point in enumerate(points):
+            expected = tree.knn(point[0], point[1], 3)
+            assert np.array_equal(indices[i], expected[0])
+            assert np.allclose(distances[i], expected[1])
+
+    indices, distances = tree.knn_many(points, 3, max_distance=10)
+    assert np.all(indices[2] == -1)
+    assert np.all(np.isinf(distances[2]))
+
+    indices, distances = RBush(4).knn_many(points, 3)
+    assert np.all(indices == -1)
+
+
+def test_search_many():
+    queries = np.array([[40, 20, 80, 70], [200, 200, 210, 210],
+                        [0, 0, 10, 10]])
+    tree1 = RBush(4)
+    tree1.load(data_array)
+    tree2 = RBush(4)
+    for i in range(len(data_array)):
+        tree2.insert(*data_array[i])
+
+    for tree in (tree1, tree2):
+        offsets, indices = tree.search_many(queries)
+        assert len(offsets) == len(queries) + 1
+        for i, query in enumerate(queries):
+            items, _ = tree.search(*query)
+            found = indices[offsets[i]:offsets[i+1]]
+            # ids are the items positions in 'data_array'
+            assert (sorted(map(tuple, data_array[found])) ==
+                    sorted(map(tuple, items)))
+
+
+def test_search_many_data():
+    # packing the tree for 'search_many' keeps mixed items data as is
+    tree = RBush(4)
+    tree.insert(0, 0, 1, 1, data=[1])
+    tree.insert(2, 2, 3, 3, data=['a'])
+    tree.search_many([[0, 0, 5, 5]])
+    assert tree.search(0, 0, 1, 1)[1].tolist() == [1]
+    assert tree.search(2, 2, 3, 3)[1].tolist() == ['a']
+
+    tree.discard([1])
+    tree.compact()
+    assert tree.search(0, 0, 1, 1)[1].tolist() == [1]
+
+
+def test_search_many_nodes():
+    # small batches walk a modified tree, large ones pack it again
+    np.random.seed(5)
+    data = np.random.random((2000, 2)) * 100
+    data = np.hstack([data, data + np.random.random((2000, 2))])
+    tree = RBush(8)
+    tree.insert(*data.T)
+    tree.discard(np.arange(0, 2000, 3))
+    queries = np.array([[0, 0, 30, 30], [200, 200, 210, 210],
+                        [40, 20, 80, 70]])
+    points = np.array([[10, 10], [50, 50], [90, 40]])
+
+    offsets, ids = tree.search_many(queries)
+    indices, distances = tree.knn_many(points, 5)
+    assert tree._packed is None
+    for i, query in enumerate(queries):
+        expected = tree.search(*query, return_indices=True)
+        assert np.array_equal(np.sort(ids[offsets[i]:offsets[i+1]]),
+                              np.sort(expected))
+    tree._pack()
+    packed_indices, packed_distances = tree.knn_many(points, 5)
+    assert np.array_equal(indices, packed_indices)
+    assert np.allclose(distances, packed_distances)
+
+    tree.insert(0, 0, 1, 1)
+    tree.search_many(np.tile(queries, (10, 1)))
+    assert tree._packed is not None
+
+
+def test_search_many_workers():
+    queries = np.array([[40, 20, 80, 70], [200, 200, 210, 210],
+                        [0, 0, 10, 10]])
+    tree = RBush(4)
+    tree.load(data_array)
+    offsets1, indices1 = tree.search_many(queries)
+    for workers in (2, -1):
+        offsets2, indices2 = tree.search_many(queries, workers=workers)
+        assert np.array_equal(offsets1, offsets2)
+        assert np.array_equal(indices1, indices2)
+
+
+def test_search_many_shape():
+    tree = RBush(4)
+    tree.load(data_array)
+    with pytest.raises(ValueError):
+        tree.search_many([0, 0, 1, 1])
+
+
+def test_find_empty_result():
+    tree = RBush(4)
+    tree.load(data_array)
+    items, data = tree.search(200, 200, 210, 210)
+    assert len(items) == len(data) == 0
+
+    tree.insert(*data_array[0])
+    items, data = tree.search(200, 200, 210, 210)
+    assert len(items) == len(data) == 0
+
+
+def test_search_indices():
+    tree1 = RBush(4)
+    tree1.load(data_array)
+    tree2 = RBush(4)
+    for i in range(len(data_array)):
+        tree2.insert(*data_array[i])
+
+    for tree in (tree1, tree2):
+        indices = tree.search(40, 20, 80, 70, return_indices=True)
+        items, _ = tree.search(40, 20, 80, 70)
+        assert indices.dtype == np.int64
+        assert sorted_equal(data_array[indices], items)
+
+        indices = tree.all(return_indices=True)
+        assert np.array_equal(np.sort(indices), np.arange(len(data_array)))
 
 
 def test_retrieve_all():
@@ -293,6 +598,103 @@ def test_remove_items():
     assert sorted_equal(data_array[:3], items_removed)
 
 
+def test_remove_shrinks_bbox():
+    tree = RBush(4)
+    tree.insert(*data_array.T)
+    tree.insert(200, 200, 300, 300)
+    tree.remove(200, 200, 300, 300)
+
+    assert tree.xmax == data_array[:, 2].max()
+    assert tree.ymax == data_array[:, 3].max()
+
+
+def test_remove_exact_bbox():
+    # overlapping (but different) boxes are kept
+    tree = RBush(4)
+    tree.insert(*data_array.T)
+    tree.insert(0, 0, 100, 100)
+    items = tree.remove(0, 0, 100, 100)
+
+    assert len(items) == 1
+    assert tree.all(return_indices=True).size == len(data_array)
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_remove_id(packed):
+    tree = RBush(4)
+    if packed:
+        tree.load(data_array)
+    else:
+        tree.insert(*data_array.T, data=np.arange(len(data_array)) * 10)
+
+    items = tree.remove(5)
+    assert len(items) == 1
+    assert items[0].id == 5
+    assert np.array_equal(items[0].bbox, data_array[5])
+    assert tree.remove(5) == []
+
+    ids = tree.all(return_indices=True)
+    assert np.array_equal(np.sort(ids), np.delete(np.arange(48), 5))
+
+
+def test_update():
+    tree = RBush(4)
+    tree.insert(*data_array.T, data=np.arange(len(data_array)) * 10)
+    tree.update(3, 200, 200, 210, 210)
+
+    bboxes, data = tree.search(190, 190, 220, 220)
+    assert np.array_equal(bboxes, [[200, 200, 210, 210]])
+    assert list(data) == [30]
+    assert tree.search(25, 0, 25, 0, return_indices=True).size == 0
+    with pytest.raises(ValueError):
+        tree.update(100, 0, 0, 1, 1)
+
+
+def test_update_in_leaf():
+    tree = RBush(4)
+    tree.insert(*data_array.T)
+    leaf = tree._index[0]
+    tree.update(0, 1, 1, 1, 1)
+
+    assert tree._index[0] is leaf
+    assert tree.search(1, 1, 1, 1, return_indices=True).tolist() == [0]
+    assert tree.search(0, 0, 0, 0, return_indices=True).size == 0
+
+
+def test_update_many():
+    tree = RBush(4)
+    tree.insert(*data_array.T, data=np.arange(len(data_array)) * 10)
+    moved = data_array.copy()
+    moved[::2] += 1
+    moved[1::4] += 50
+    tree.update_many(np.arange(len(moved)), *moved.T)
+
+    for query in ([0, 0, 30, 30], [40, 20, 80, 70], [50, 50, 150, 150]):
+        bboxes, data = tree.search(*query)
+        assert np.array_equal(np.sort(data // 10),
+                              brute_force(moved, *query))
+        assert np.array_equal(bboxes, moved[data // 10])
+
+    with pytest.raises(ValueError):
+        tree.update_many([0, 100], *moved[:2].T)
+
+
+def test_id_index():
+    tree = RBush(4)
+    tree.load(data_array)
+    tree.insert(*data_array.T)
+    tree.insert(*data_array.T, batch=True)
+    tree.load(data_array[:10])
+    for i in range(0, 150, 7):
+        tree.remove(i)
+    tree.update(1, 0, 0, 10, 10)
+    tree.update_many([2, 3, 4], [0, 50, 90], [0, 50, 90], [5, 55, 95],
+                     [5, 55, 95])
+
+    check_tree(tree, 1, 4)
+    assert len(tree._index) == 154 - 22
+
+
 def test_remove_nothing():
     # 'remove' does nothing if nothing found
     tree1 = RBush()
@@ -308,6 +710,30 @@ def test_remove_nothing():
     assert sorted_equal(items1, items2)
 
 
+@pytest.mark.parametrize('by_id', [False, True])
+def test_remove_condense(by_id):
+    np.random.seed(1)
+    data = np.random.randint(0, 1000, (500, 2))
+    data = np.hstack([data, data + 10])
+    tree = RBush(4, 2)
+    tree.insert(*data.T)
+    height = tree.height
+
+    removed = np.random.permutation(len(data))[:450]
+    for i in removed:
+        if by_id:
+            tree.remove(i)
+        else:
+            tree.remove(*data[i])
+
+    # no underfull node left, a shorter tree, all the rest still found
+    assert tree.height < height
+    check_tree(tree, 2, 4)
+    alive = np.setdiff1d(np.arange(len(data)), removed)
+    assert np.array_equal(np.sort(tree.all(return_indices=True)), alive)
+    assert sorted(tree._index) == list(alive)
+
+
 # remove brings the tree to a clear state when removing everything one by one
 def test_clean_tree():
     tree = RBush(4)
@@ -320,6 +746,16 @@ def test_clean_tree():
     assert tree.to_json() == RBush(4).to_json()
 
 
+# children bboxes cached by 'insert' follow the tree changes
+def test_cached_child_boxes():
+    tree = RBush(4)
+    tree.insert(*data_array.T)
+    for i in range(0, len(data_array), 3):
+        tree.remove(*data_array[i])
+    tree.insert(*data_array[::2].T)
+    check_tree(tree, 1, 4)
+
+
 # clear should clear all the data in the tree
 def test_clear_tree():
     tree = RBush(4)
@@ -339,21 +775,40 @@ def test_chain():
     assert sorted_equal(data_array, items)
 
 
-# # collides returns true when search finds matching points'
-# def test_find_collision():
-#     tree = RBush(4)
-#     tree.load(data)
-#     result = tree.collides({'xmin': 40, 'ymin': 20, 'xmax': 80, 'ymax': 70})
-#     assert result
+# collides returns true when search finds matching points
+def test_find_collision():
+    tree = RBush(4)
+    tree.load(data_array)
+    assert tree.collides(40, 20, 80, 70)
+
+    tree.insert(*data_array[0])
+    assert tree.collides(40, 20, 80, 70)
+
+
+# collides returns false if nothing found
+def test_find_no_collision():
+    tree = RBush(4)
+    tree.load(data_array)
+    assert not tree.collides(200, 200, 210, 210)
+
+    tree.insert(*data_array[0])
+    assert not tree.collides(200, 200, 210, 210)
+
+
+def test_count():
+    queries = [[40, 20, 80, 70], [200, 200, 210, 210], [0, 0, 10, 10],
+               [-Infinity, -Infinity, Infinity, Infinity]]
+    tree1 = RBush(4)
+    tree1.load(data_array)
+    tree2 = RBush(4)
+    for i in range(len(data_array)):
+        tree2.insert(*data_array[i])
+
+    for tree in (tree1, tree2):
+        for query in queries:
+            items, _ = tree.search(*query)
+            assert tree.count(*query) == len(items)
 
-# # collides returns false if nothing found
-# def test_find_no_collision():
-#     tree = RBush(4)
-#     tree.load(data)
-#     # result = tree.collides([200, 200, 210, 210])
-#     result = tree.collides(arr_to_bbox([200, 200, 210, 210]))
-#
-#     assert not result
 
 # t('constructor accepts a format argument to customize the data format',
 # def test_format_argument():
@@ -380,3 +835,391 @@ def test_chain():
 #     tree.remove(item, lambda a,b: a['foo'] == b['foo'])
 #
 #     sorted_equal(tree.all(), data)
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_discard(packed):
+    tree = RBush(4)
+    if packed:
+        tree.load(data_array)
+    else:
+        tree.insert(*data_array.T)
+    discarded = np.arange(0, len(data_array), 3)
+    alive = np.setdiff1d(np.arange(len(data_array)), discarded)
+    tree.discard(discarded)
+    assert tree._ndead == len(discarded)
+
+    assert np.array_equal(np.sort(tree.all(return_indices=True)), alive)
+    query = [-Infinity, -Infinity, Infinity, Infinity]
+    assert tree.count(*query) == len(alive)
+    assert tree.search(0, 0, 0, 0, return_indices=True).size == 0
+    assert not tree.collides(0, 0, 0, 0)
+    for window in ([20, 20, 60, 60], [0, 0, 30, 30], [3, 3, 3, 3]):
+        expected = np.intersect1d(brute_force(data_array, *window), alive)
+        assert tree.count(*window) == len(expected)
+        assert tree.collides(*window) == (len(expected) > 0)
+    offsets, indices = tree.search_many([query])
+    assert np.array_equal(np.sort(indices), alive)
+
+    dist = np.hypot(data_array[:, 0] - 40, data_array[:, 1] - 40)
+    dist[discarded] = np.inf
+    indices, distances = tree.knn(40, 40, 5)
+    assert np.allclose(distances, np.sort(dist)[:5])
+    assert not np.isin(indices, discarded).any()
+    indices, _ = tree.knn_many([[40, 40]], 5)
+    assert not np.isin(indices, discarded).any()
+
+    assert tree.remove(0) == []
+    assert tree._ndead == len(discarded) - 1
+    with pytest.raises(ValueError):
+        tree.update(3, 0, 0, 1, 1)
+
+    # ids of items gone before the tree was emptied and loaded are ignored
+    tree = RBush(4)
+    tree.insert(*data_array[:5].T)
+    for item_id in range(5):
+        tree.remove(item_id)
+    tree.load(data_array)
+    tree.discard([0, 1, 2, 5])
+    assert tree._ndead == 1
+    assert len(tree.all(return_indices=True)) == len(data_array) - 1
+
+
+def test_compact():
+    tree = RBush(4)
+    tree.load(data_array, data=np.arange(len(data_array)) * 10)
+    tree.discard(np.arange(10), max_dead=0.5)
+    assert tree._ndead == 10
+
+    # past 'max_dead', the tree is rebuilt without discarded items
+    tree.discard(np.arange(10, 30), max_dead=0.5)
+    assert tree._ndead == 0
+    assert tree._size() == len(data_array) - 30
+    ids = tree.all(return_indices=True)
+    _, data = tree.all()
+    assert np.array_equal(np.sort(ids), np.arange(30, len(data_array)))
+    assert np.array_equal(data, ids * 10)
+
+    # ids gone stay unknown
+    tree.discard(np.arange(40), max_dead=1)
+    assert tree._ndead == 10
+    tree.compact()
+    assert np.array_equal(np.sort(tree.all(return_indices=True)),
+                          np.arange(40, len(data_array)))
+
+
+def test_rwlock():
+    lock = RWLock()
+    entered = threading.Event()
+
+    def read():
+        with lock.read():
+            entered.set()
+
+    with lock.write():
+        with lock.read():  # reentrant for the writer
+            pass
+        reader = threading.Thread(target=read)
+        reader.start()
+        assert not entered.wait(0.1)
+    assert entered.wait(5)
+    reader.join()
+
+    # readers share it
+    with lock.read():
+        entered.clear()
+        reader = threading.Thread(target=read)
+        reader.start()
+        assert entered.wait(5)
+        reader.join()
+
+
+def test_threadsafe():
+    tree = RBush(threadsafe=True)
+    tree.load(np.array(data_array, dtype=np.float64))
+    num_items = len(data_array)
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        try:
+            while not stop.is_set():
+                ids = tree.search(0, 0, 100, 100, return_indices=True)
+                assert len(np.unique(ids)) == len(ids)
+                assert num_items <= len(ids) <= num_items + 100
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for i in range(100):
+        tree.insert(i % 100, i % 100, i % 100 + 1, i % 100 + 1)
+    for i in range(0, 100, 2):
+        tree.remove(num_items + i)
+    stop.set()
+    for reader in readers:
+        reader.join()
+
+    assert not errors
+    assert len(tree.all(return_indices=True)) == num_items + 50
+
+
+def test_threadsafe_pack(monkeypatch):
+    # readers of a modified tree pack it once, and share it
+    tree = RBush(4, threadsafe=True)
+    tree.insert(*data_array.T)
+    calls = []
+    pack_tree = rbush.packed.pack_tree
+
+    def slow_pack_tree(root):
+        calls.append(root)
+        time.sleep(0.05)
+        return pack_tree(root)
+    monkeypatch.setattr(rbush.packed, 'pack_tree', slow_pack_tree)
+
+    results = []
+    readers = [threading.Thread(
+        target=lambda: results.append(tree.search_many([[0, 0, 50, 50]])))
+        for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    assert len(calls) == 1
+    assert len(results) == 4
+    for offsets, found in results:
+        assert np.array_equal(np.sort(found),
+                              brute_force(data_array, 0, 0, 50, 50))
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_snapshot(packed):
+    np.random.seed(3)
+    data = np.random.random((500, 2)) * 100
+    data = np.hstack([data, data + np.random.random((500, 2))])
+    tree = RBush(4)
+    if packed:
+        tree.load(data, data=np.arange(500))
+    else:
+        tree.insert(*data.T, data=np.arange(500))
+    snapshot = tree.snapshot()
+    expected = snapshot.search(20, 20, 60, 60)
+
+    tree.insert(*data[0] + 1)
+    if not packed:
+        # only the nodes along the path to the new item were copied: other
+        # leaves are still shared with the snapshot
+        leaves = []
+        nodes = [snapshot._root]
+        while nodes:
+            node = nodes.pop()
+            if node.leaf:
+                leaves.append(node)
+            else:
+                nodes.extend(node.children)
+        copied = [leaf for leaf in leaves
+                  if tree._index[leaf.children[0].id] is not leaf]
+        assert len(copied) == 1
+    tree.insert(*data[:50].T + 1)
+    tree.insert(*data[:50].T + 2, batch=True)
+    tree.update(0, 0, 0, 1, 1)
+    tree.update_many([1, 2, 3], [5, 50, 90], [5, 50, 90], [6, 51, 91],
+                     [6, 51, 91])
+    tree.remove(4)
+    tree.remove(*data[5])
+    tree.discard([6, 7])
+    assert len(tree.all(return_indices=True)) == 500 + 101 - 4
+
+    # items of the same (shared) leaf, updated at once
+    tree.snapshot()
+    ids = [item.id for item in tree._index[8].children[:2]]
+    tree.update_many(ids, [10, 11], [10, 11], [11, 12], [11, 12])
+    found = tree.search(10, 10, 12, 12, return_indices=True)
+    assert set(ids) <= set(found)
+    assert len(snapshot.all(return_indices=True)) == 500
+
+    # the snapshot does not change, and shares the nodes left untouched
+    bboxes, items = snapshot.search(20, 20, 60, 60)
+    assert np.array_equal(bboxes, expected[0])
+    assert np.array_equal(items, expected[1])
+    assert len(snapshot.all(return_indices=True)) == 500
+
+    with pytest.raises(ValueError):
+        snapshot.insert(0, 0, 1, 1)
+    with pytest.raises(ValueError):
+        snapshot.remove(10)
+
+
+def test_snapshot_threads():
+    tree = RBush(4, threadsafe=True)
+    tree.insert(*np.array(data_array, dtype=np.float64).T)
+    num_items = len(data_array)
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        try:
+            while not stop.is_set():
+                snapshot = tree.snapshot()
+                ids = snapshot.search(0, 0, 100, 100, return_indices=True)
+                assert len(np.unique(ids)) == len(ids)
+                assert np.array_equal(
+                    np.sort(ids), np.sort(snapshot.all(return_indices=True)))
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for reader in readers:
+        reader.start()
+    for i in range(200):
+        tree.insert(i % 100, i % 100, i % 100 + 1, i % 100 + 1)
+        tree.remove(num_items + i)
+    stop.set()
+    for reader in readers:
+        reader.join()
+
+    assert not errors
+    assert len(tree.all(return_indices=True)) == num_items
+
+
+def test_share():
+    pytest.importorskip('multiprocessing.shared_memory')
+    tree = RBush(4)
+    tree.insert(*data_array.T, data=np.arange(len(data_array)) * 10)
+    tree.discard([0, 1])
+    block = tree.share()
+    try:
+        shared = RBush.attach(block.name)
+        assert shared.maxentries == 4
+        assert shared.height == tree.height
+        for query in ([0, 0, 50, 50], [20, 20, 100, 60]):
+            bboxes, data = shared.search(*query)
+            expected = tree.search(*query)
+            assert np.array_equal(np.sort(data), np.sort(expected[1]))
+        assert np.array_equal(shared.knn(40, 40, 5)[0],
+                              tree.knn(40, 40, 5)[0])
+        with pytest.raises(ValueError):
+            shared.insert(0, 0, 1, 1)
+        del shared, bboxes, data
+    finally:
+        block.close()
+        block.unlink()
+
+    # python objects can't be shared
+    tree = RBush(4)
+    tree.insert(*data_array.T, data=['a'] * len(data_array))
+    tree.insert(0, 0, 1, 1, data=[{}])
+    with pytest.raises(ValueError):
+        tree.share()
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_save_open(tmp_path, mmap):
+    path = str(tmp_path / 'tree.rbush')
+    tree = RBush(4)
+    tree.load(data_array, data=np.arange(len(data_array)) * 10)
+    tree.insert(5, 5, 6, 6, data=[-10])
+    tree.discard([0, 1])
+    tree.save(path)
+
+    opened = RBush.open(path, mmap=mmap)
+    assert opened.maxentries == 4
+    assert opened.height == tree.height
+    assert np.array_equal(np.sort(opened.all(return_indices=True)),
+                          np.sort(tree.all(return_indices=True)))
+    for query in ([0, 0, 50, 50], [20, 20, 100, 60]):
+        bboxes, data = opened.search(*query)
+        expected = tree.search(*query)
+        order, expected_order = np.argsort(data), np.argsort(expected[1])
+        assert np.array_equal(data[order], expected[1][expected_order])
+        assert np.array_equal(bboxes[order], expected[0][expected_order])
+    assert np.array_equal(opened.knn(40, 40, 5)[0], tree.knn(40, 40, 5)[0])
+
+    # the opened tree can be modified, the file is left untouched
+    opened.insert(1, 1, 2, 2, data=[-20])
+    opened.discard([2])
+    assert len(opened.search(1, 1, 2, 2)[0]) == 1
+    assert opened.all(return_indices=True).max() == len(data_array) + 1
+    del opened
+    reopened = RBush.open(path, mmap=mmap)
+    assert len(reopened.all(return_indices=True)) == len(data_array) - 1
+
+    # saved over the file it was opened (mapped) from
+    reopened.discard([3, 4])
+    reopened.save(path)
+    expected = np.sort(reopened.all(return_indices=True))
+    assert np.array_equal(np.sort(RBush.open(path).all(True)), expected)
+
+    # a failed save leaves the file as it was
+    objects = RBush(4).load(data_array, data=[{}] * len(data_array))
+    with pytest.raises(ValueError):
+        objects.save(path)
+    assert np.array_equal(np.sort(RBush.open(path).all(True)), expected)
+    assert os.listdir(str(tmp_path)) == ['tree.rbush']
+
+
+@pytest.mark.parametrize('protocol', [2, pickle.HIGHEST_PROTOCOL])
+def test_pickle(protocol):
+    tree = RBush(4, threadsafe=True)
+    tree.load(data_array, data=np.arange(len(data_array)) * 10)
+    tree.insert(5, 5, 6, 6, data=[-10])
+    tree.discard([0, 1])
+
+    buffers = []
+    kwargs = {}
+    if protocol >= 5:
+        # arrays are sent out-of-band
+        kwargs = dict(buffer_callback=buffers.append)
+    dumped = pickle.dumps(tree, protocol=protocol, **kwargs)
+    if protocol >= 5:
+        assert buffers
+        loaded = pickle.loads(dumped, buffers=buffers)
+    else:
+        loaded = pickle.loads(dumped)
+    assert isinstance(loaded._lock, RWLock)
+    assert loaded.maxentries == 4
+    assert loaded.height == tree.height
+    assert np.array_equal(np.sort(loaded.all()[1]), np.sort(tree.all()[1]))
+    assert np.array_equal(loaded.knn(40, 40, 5)[0], tree.knn(40, 40, 5)[0])
+
+    # both trees are modified independently
+    tree.discard([2])
+    loaded.insert(1, 1, 2, 2, data=[-20])
+    assert len(loaded.all()[1]) == len(data_array)
+    assert len(tree.all()[1]) == len(data_array) - 2
+
+    # python objects data are pickled too
+    data = [{'i': i} for i in range(len(data_array))]
+    tree = RBush(4).load(data_array, data=data)
+    loaded = pickle.loads(pickle.dumps(tree, protocol=protocol))
+    assert sorted(d['i'] for d in loaded.all()[1]) == \
+        list(range(len(data_array)))
+
+
+def test_to_bytes():
+    tree = RBush(4)
+    tree.load(data_array, data=np.arange(len(data_array)) * 10)
+    tree.discard([0, 1])
+    buffer = tree.to_bytes()
+    assert isinstance(buffer, bytes)
+
+    loaded = RBush.from_bytes(buffer)
+    assert loaded.to_bytes() == buffer
+    assert np.array_equal(np.sort(loaded.all()[1]), np.sort(tree.all()[1]))
+    for query in ([0, 0, 50, 50], [20, 20, 100, 60]):
+        assert np.array_equal(np.sort(loaded.search(*query)[1]),
+                              np.sort(tree.search(*query)[1]))
+
+    # the loaded tree can be modified, not the original one
+    loaded.discard([2])
+    loaded.insert(1, 1, 2, 2, data=[-20])
+    assert len(loaded.search(1, 1, 2, 2)[1]) == 1
+    assert len(tree.all()[1]) == len(data_array) - 2
+
+    data = [{'i': i} for i in range(len(data_array))]
+    tree = RBush(4).load(data_array, data=data)
+    with pytest.raises(ValueError):
+        tree.to_bytes()
+    with pytest.raises(ValueError):
+        RBush.from_bytes(b'not a tree')
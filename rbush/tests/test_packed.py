@@ -0,0 +1,198 @@
+import numpy as np
+import pytest
+
+from rbush import RBush
+from rbush.packed import (pack, pack_tree, search, search_many, unpack,
+                          count, collides, knn)
+from rbush.data import generate_data_array
+from rbush.node import heightf, childrenf
+
+
+def generate_boxes(n, size):
+    # 'generate_data_array' may give 'xmax < xmin' (or 'ymax < ymin')
+    data = generate_data_array(n, size)
+    return np.hstack([np.minimum(data[:, :2], data[:, 2:]),
+                      np.maximum(data[:, :2], data[:, 2:])])
+
+
+def brute_force(boxes, xmin, ymin, xmax, ymax):
+    mask = ((boxes[:, 0] <= xmax) & (boxes[:, 1] <= ymax) &
+            (boxes[:, 2] >= xmin) & (boxes[:, 3] >= ymin))
+    return np.flatnonzero(mask)
+
+
+def check_layout(tree, data, maxentries):
+    # items point back into the loaded array
+    assert np.array_equal(np.sort(tree.items), np.arange(len(data)))
+    assert np.array_equal(tree.item_bboxes, data[tree.items])
+
+    # every node bbox covers its (contiguous) children
+    for i in range(len(tree.bboxes)):
+        first = tree.offsets[i]
+        last = first + tree.counts[i]
+        if tree.heights[i] == 1:
+            children = tree.item_bboxes[first:last]
+        else:
+            children = tree.bboxes[first:last]
+            assert np.all(tree.heights[first:last] < tree.heights[i])
+        assert 0 < tree.counts[i] <= maxentries
+        if tree.heights[i] == 1:
+            assert tree.sizes[i] == tree.counts[i]
+        else:
+            assert tree.sizes[i] == tree.sizes[first:last].sum()
+        assert np.array_equal(tree.bboxes[i],
+                              [children[:, 0].min(), children[:, 1].min(),
+                               children[:, 2].max(), children[:, 3].max()])
+
+
+def test_pack_layout():
+    data = generate_data_array(1000, 10)
+    original = data.copy()
+    tree = pack(data, 9)
+
+    # input array is left untouched
+    assert np.array_equal(data, original)
+    check_layout(tree, data, 9)
+
+
+def test_pack_hilbert():
+    data = generate_data_array(1000, 10)
+    tree = pack(data, 9, method='hilbert')
+    check_layout(tree, data, 9)
+
+    # nodes are full, but the last one of each level
+    assert np.sum(tree.counts < 9) <= tree.heights[0]
+
+    found = tree.items[search(tree, -10, -10, 10, 10)]
+    assert np.array_equal(np.sort(found), brute_force(data, -10, -10, 10, 10))
+
+
+def test_pack_method():
+    data = generate_data_array(100, 10)
+    with pytest.raises(ValueError):
+        pack(data, 9, method='str')
+
+
+def test_pack_workers():
+    data = generate_data_array(1000, 10)
+    tree1 = pack(data, 9)
+    for workers in (2, -1):
+        tree2 = pack(data, 9, workers=workers)
+        for name in tree1._fields:
+            assert np.array_equal(getattr(tree1, name), getattr(tree2, name))
+
+
+def test_pack_leaf_root():
+    data = generate_data_array(3, 10)
+    tree = pack(data, 4)
+    assert len(tree.bboxes) == 1
+    assert tree.heights[0] == 1
+    assert tree.counts[0] == 3
+    assert np.array_equal(tree.bboxes[0], [data[:, 0].min(), data[:, 1].min(),
+                                           data[:, 2].max(), data[:, 3].max()])
+
+
+def test_pack_data():
+    data = generate_data_array(100, 10)
+    tree = pack(data, 4, data=np.arange(100) * 2)
+    assert np.array_equal(tree.data, tree.items * 2)
+
+
+def test_pack_search():
+    data = generate_data_array(1000, 10)
+    tree = pack(data, 9)
+    found = tree.items[search(tree, -10, -10, 10, 10)]
+    assert np.array_equal(np.sort(found), brute_force(data, -10, -10, 10, 10))
+
+
+def test_pack_search_wide():
+    # nodes with many children grow the kernels stack
+    data = generate_boxes(20000, 10)
+    tree = pack(data, 200)
+    assert tree.counts[0] > 64
+    found = tree.items[search(tree, -100, -100, 100, 100)]
+    assert np.array_equal(np.sort(found), np.arange(20000))
+    assert count(tree, -100, -100, 100, 100, dead=np.zeros(1, bool)) == 20000
+    for workers in (1, 2):
+        offsets, found = search_many(tree, [[-100, -100, 100, 100]],
+                                     workers=workers)
+        assert np.array_equal(np.sort(tree.items[found]), np.arange(20000))
+
+
+def test_pack_count():
+    data = generate_boxes(1000, 10)
+    queries = generate_boxes(50, 10)
+    tree = pack(data, 9)
+    for query in queries:
+        expected = len(brute_force(data, *query))
+        assert count(tree, *query) == expected
+        assert collides(tree, *query) == (expected > 0)
+
+
+def test_pack_knn():
+    data = generate_boxes(1000, 10)
+    tree = pack(data, 9)
+    dx = np.maximum(np.maximum(data[:, 0] - 5, 0), 5 - data[:, 2])
+    dy = np.maximum(np.maximum(data[:, 1] - 5, 0), 5 - data[:, 3])
+    dist = np.hypot(dx, dy)
+
+    found, distances = knn(tree, 5, 5, 20)
+    assert np.allclose(distances, np.sort(dist)[:20])
+    assert np.allclose(dist[tree.items[found]], distances)
+
+    found, distances = knn(tree, 5, 5, 1000, max_distance=3)
+    assert len(found) == np.sum(dist <= 3)
+
+
+def test_pack_dead():
+    data = generate_boxes(1000, 10)
+    tree = pack(data, 9)
+    dead = np.zeros(1000, dtype=bool)
+    dead[::2] = True
+    alive = brute_force(data, -10, -10, 10, 10)
+    alive = alive[~dead[alive]]
+
+    found = tree.items[search(tree, -10, -10, 10, 10, dead=dead)]
+    assert np.array_equal(np.sort(found), alive)
+    assert count(tree, -10, -10, 10, 10, dead=dead) == len(alive)
+    assert count(tree, -100, -100, 100, 100, dead=dead) == 500
+    offsets, found = search_many(tree, [[-10, -10, 10, 10]], dead=dead)
+    assert np.array_equal(np.sort(tree.items[found]), alive)
+    found, _ = knn(tree, 0, 0, 20, dead=dead)
+    assert not dead[tree.items[found]].any()
+
+
+def test_pack_search_many():
+    data = generate_data_array(1000, 10)
+    queries = generate_data_array(50, 10)
+    tree = pack(data, 9)
+    offsets, found = search_many(tree, queries)
+    for i, query in enumerate(queries):
+        assert np.array_equal(found[offsets[i]:offsets[i+1]],
+                              search(tree, *query))
+
+
+def test_unpack():
+    data = generate_data_array(100, 10)
+    tree = pack(data, 4)
+    root = unpack(tree)
+    assert heightf(root) == tree.heights[0]
+    assert len(childrenf(root)) == tree.counts[0]
+
+
+def test_pack_tree():
+    data = generate_data_array(100, 10)
+    tree = pack(data, 4)
+    repacked = pack_tree(unpack(tree))
+    for name in tree._fields:
+        if name != 'data':
+            assert np.array_equal(getattr(tree, name), getattr(repacked, name))
+
+
+def test_load_packed_search():
+    data = generate_data_array(1000, 10)
+    tree = RBush().load(data, data=np.arange(1000))
+    bboxes, items = tree.search(-10, -10, 10, 10)
+    expected = brute_force(data, -10, -10, 10, 10)
+    assert np.array_equal(np.sort(items), expected)
+    assert np.array_equal(bboxes, data[items])
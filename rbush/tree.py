@@ -1,69 +1,437 @@
-import math
+import heapq
+
 import numpy as np
 
 from .node import *
+from .packed import pack, unpack
+
+# fraction of an overflowing node children inserted again (R*-tree)
+REINSERT = 0.3
+
+
+def remove(root, xmin, ymin, xmax, ymax, maxentries, minentries,
+           index=None, strategy='rbush', split_method='rstar'):
+    """
+    Remove the items with bbox 'xmin,ymin,xmax,ymax'
+
+    Nodes left with less than 'minentries' children are dissolved (see
+    'condense', inserting their children back with 'strategy' and
+    'split_method').  'index', if given, is the id->leaf dict to update
+    (see 'index_leaves').  Return the (new) root and the list of removed
+    items
+    """
+    target = create_item((xmin, ymin, xmax, ymax))
+    orphans = []
+    items = remove_item(root, target, equals, minentries, orphans, index)
+    if index is not None:
+        for item in items:
+            index.pop(idf(item), None)
+    if items:
+        root = condense(root, orphans, maxentries, minentries, index,
+                        strategy, split_method)
+    return root, items
+
+
+def remove_id(root, item_id, maxentries, minentries, index,
+              strategy='rbush', split_method='rstar'):
+    """
+    Remove the item 'item_id' found from 'index' (see 'remove')
+
+    Return the (new) root and the list of removed items (empty if unknown)
+    """
+    leaf = index.pop(item_id, None)
+    if leaf is None:
+        return root, []
+    path = find_path(root, leaf)
+    children = childrenf(leaf)
+    for i in range(len(children)):
+        if idf(children[i]) == item_id:
+            item = children.pop(i)
+            break
+
+    # dissolve underfull nodes, then shrink the bboxes along the path (as
+    # long as they do change)
+    orphans = []
+    for level in range(len(path)-1, 0, -1):
+        node = get(path, level)
+        parent = get(path, level-1)
+        if len(childrenf(node)) < minentries:
+            childrenf(parent).remove(node)
+            if len(childrenf(node)):
+                orphans.append(node)
+        else:
+            bbox = list(node.bbox)
+            if adjust_bbox(node).bbox == bbox:
+                break
+        reset_boxes(parent)
+    else:
+        adjust_bbox(root)
+    root = condense(root, orphans, maxentries, minentries, index, strategy,
+                    split_method)
+    return root, [item]
+
+
+def condense(root, orphans, maxentries, minentries, index=None,
+             strategy='rbush', split_method='rstar'):
+    """
+    Insert back the children of (dissolved) 'orphans' nodes, at their level
+    (see 'insert_node'), then cut the root while it has a single child.
+    Return the (new) root
+    """
+    if not leaff(root) and len(childrenf(root)) == 0:
+        root = create_root()
+    for node in orphans:
+        for child in childrenf(node):
+            if leaff(node):
+                root = insert_node(root, child, maxentries, minentries,
+                                   index=index, strategy=strategy,
+                                   split_method=split_method)
+            else:
+                root = merge(root, child, maxentries, minentries, strategy,
+                             split_method)
+    while not leaff(root) and len(childrenf(root)) == 1:
+        root = get(childrenf(root), 0)
+    return root
 
 
+def update(root, item_id, xmin, ymin, xmax, ymax,
+           maxentries, minentries, index, strategy='rbush',
+           split_method='rstar'):
+    """
+    Move item 'item_id' to bbox 'xmin,ymin,xmax,ymax' (keeping id and data)
 
-def remove(root, xmin, ymin, xmax, ymax):
+    The item stays in its leaf when the new bbox fits in the leaf, or in the
+    leaf parent (the leaf being enlarged); otherwise it is removed and
+    inserted again. Return the (new) root
+    """
     bbox = (xmin, ymin, xmax, ymax)
-    # return remove_item(root, bbox, lambda bbox,node:bbox[0]==xminf(node))
-    return remove_item(root, bbox, intersects)
+    if not move_item(root, index[item_id], item_id, bbox):
+        root, items = remove_id(root, item_id, maxentries, minentries, index,
+                                strategy, split_method)
+        root = insert(root, [xmin], [ymin], [xmax], [ymax], [items[0].data],
+                      maxentries, minentries, ids=[item_id], index=index,
+                      strategy=strategy, split_method=split_method)
+    return root
+
+
+def update_many(root, ids, xmin, ymin, xmax, ymax,
+                maxentries, minentries, index, strategy='rbush',
+                split_method='rstar'):
+    """
+    Move items [ids] to bboxes [xmin],[ymin],[xmax],[ymax] (see 'update')
+
+    Items not fitting in their leaf (or leaf parent) are inserted back
+    all together (see 'insert_batch'). Return the (new) root
+    """
+    leaves = [index[item_id] for item_id in ids]
+    bboxes = np.array([leaf.bbox for leaf in leaves]).reshape(-1, 4)
+    fits = ((bboxes[:, 0] <= xmin) & (bboxes[:, 1] <= ymin) &
+            (bboxes[:, 2] >= xmax) & (bboxes[:, 3] >= ymax))
+
+    moved = []
+    for i in range(len(ids)):
+        bbox = (xmin[i], ymin[i], xmax[i], ymax[i])
+        if fits[i]:
+            replace_item(leaves[i], ids[i], bbox)
+        elif not move_item(root, leaves[i], ids[i], bbox):
+            moved.append(i)
+    if not moved:
+        return root
+
+    data = []
+    for i in moved:
+        root, items = remove_id(root, ids[i], maxentries, minentries, index,
+                                strategy, split_method)
+        data.append(items[0].data)
+    return insert_batch(root, xmin[moved], ymin[moved], xmax[moved],
+                        ymax[moved], data, maxentries, minentries,
+                        ids=[ids[i] for i in moved], index=index)
+
+
+def move_item(root, leaf, item_id, bbox):
+    """
+    Give item 'item_id' of 'leaf' the new 'bbox', if it fits in 'leaf' or
+    in its parent ('leaf' is then enlarged). Return whether it was moved
+    """
+    target = create_item(bbox)
+    if not contains(leaf.bbox, target):
+        path = find_path(root, leaf)
+        if len(path) > 1:
+            parent = get(path, len(path)-2)
+            if not contains(parent.bbox, target):
+                return False
+            reset_boxes(parent)
+        extend(leaf, target)
+    replace_item(leaf, item_id, bbox)
+    return True
+
+
+def replace_item(leaf, item_id, bbox):
+    """
+    Replace item 'item_id' of 'leaf' by a copy with the new 'bbox'
+    """
+    children = childrenf(leaf)
+    for i in range(len(children)):
+        item = children[i]
+        if idf(item) == item_id:
+            children[i] = create_item(bbox, item.data, item_id)
+            return children[i]
+    return None
 
 
-def remove_item(node, bbox, is_equal):
+def find_path(node, target):
+    """
+    Return the list of nodes from 'node' down to 'target' (None if absent)
+    """
+    if node is target:
+        return [node]
+    if leaff(node):
+        return None
+    xmin, ymin, xmax, ymax = target.bbox
+    for child in childrenf(node):
+        if child is target:
+            return [node, child]
+        bbox = child.bbox
+        if leaff(child) or not (bbox[0] <= xmin and bbox[1] <= ymin and
+                                bbox[2] >= xmax and bbox[3] >= ymax):
+            continue
+        path = find_path(child, target)
+        if path is not None:
+            path.insert(0, node)
+            return path
+    return None
+
+
+def thaw_leaves(root, leaves, index=None):
+    """
+    Copy the frozen nodes (see 'thaw') on the paths from (modifiable)
+    'root' down to 'leaves', so that these can be modified in place
+
+    Return the list of leaves copies (or leaves themselves, if not frozen),
+    each leaf being copied once even if given several times
+    """
+    thawed = []
+    copies = {}
+    for leaf in leaves:
+        if id(leaf) in copies:
+            # already copied, the original is no longer in the tree
+            thawed.append(copies[id(leaf)])
+            continue
+        path = find_path(root, leaf)
+        for i in range(1, len(path)):
+            if path[i].frozen:
+                parent = path[i-1]
+                children = childrenf(parent)
+                for j in range(len(children)):
+                    if children[j] is path[i]:
+                        break
+                path[i] = thaw_child(parent, j, index)
+        copies[id(leaf)] = path[-1]
+        thawed.append(path[-1])
+    return thawed
+
+
+def index_leaves(node, index):
+    """
+    Register in 'index' dict the leaf of every item under 'node'
+    """
+    if leaff(node):
+        for item in childrenf(node):
+            index[idf(item)] = node
+    else:
+        for child in childrenf(node):
+            index_leaves(child, index)
+    return index
+
+
+def remove_item(node, target, is_equal, minentries=0, orphans=None,
+                index=None):
+    """
+    Remove and return the items under 'node' equal to 'target' item
+
+    Children losing items and left with less than 'minentries' entries are
+    taken out too, appended to 'orphans' list (if not empty). Frozen nodes
+    searched are copied (see 'thaw'), 'index' pointing to leaves copies.
+    """
     items = []
-    if not intersects(bbox, node):
+    if not contains(node.bbox, target):
         return items
     if leaff(node) is True:
         indexes = []
         for i in range(len(childrenf(node))):
             child = get(childrenf(node), i)
-            if is_equal(bbox, child):
+            if is_equal(target.bbox, child):
                 indexes.append(i)
         for i in range(len(indexes)-1, -1, -1):
-            items.append(childrenf(node).pop(i))
+            items.append(childrenf(node).pop(indexes[i]))
         if len(items) > 0:
             adjust_bbox(node)
     else:
         indexes = []
         for i in range(len(childrenf(node))):
             child = get(childrenf(node), i)
-            items.extend(remove_item(child, bbox, is_equal))
-            if len(childrenf(child)) == 0:
+            if child.frozen and contains(child.bbox, target):
+                child = thaw_child(node, i, index)
+            removed = remove_item(child, target, is_equal, minentries,
+                                  orphans, index)
+            items.extend(removed)
+            if removed and len(childrenf(child)) < minentries:
                 indexes.append(i)
         for i in range(len(indexes)-1, -1, -1):
-            empty = childrenf(node).pop(i)
+            child = childrenf(node).pop(indexes[i])
+            if orphans is not None and len(childrenf(child)):
+                orphans.append(child)
         if len(items) > 0:
+            reset_boxes(node)
             adjust_bbox(node)
     return items
 
 
 # @profile
 def insert(root, xmin, ymin, xmax, ymax, data,
-           maxentries, minentries):
+           maxentries, minentries, ids=None, index=None, strategy='rbush',
+           split_method='rstar'):
     """
-    Insert arrays [xmin],[ymin],[xmax],[ymax],[data]
+    Insert arrays [xmin],[ymin],[xmax],[ymax],[data] (and items [ids])
+
+    'index', if given, is the id->leaf dict to update (see 'index_leaves').
+    'strategy' is either 'rbush' or 'rstar' (see 'insert_node') and
+    'split_method' one of 'rstar', 'quadratic' or 'linear' (see 'split').
     """
     for i in range(len(xmin)):
-        item = create_item((xmin[i], ymin[i], xmax[i], ymax[i]), data[i])
-        root = insert_node(root, item, maxentries, minentries)
+        item_id = None if ids is None else ids[i]
+        item = create_item((xmin[i], ymin[i], xmax[i], ymax[i]), data[i],
+                           item_id)
+        root = insert_node(root, item, maxentries, minentries, index=index,
+                           strategy=strategy, split_method=split_method)
     return root
 
 
+def insert_batch(root, xmin, ymin, xmax, ymax, data,
+                 maxentries, minentries, ids=None, index=None):
+    """
+    Insert arrays [xmin],[ymin],[xmax],[ymax],[data] (and items [ids])
+
+    Items are routed all together down to their leaves; each node is then
+    split (once) if overflowing, and has its bbox adjusted once
+    """
+    items = []
+    for i in range(len(xmin)):
+        item_id = None if ids is None else ids[i]
+        items.append(create_item((xmin[i], ymin[i], xmax[i], ymax[i]),
+                                 data[i], item_id))
+    boxes = np.column_stack([xmin, ymin, xmax, ymax]).astype(np.float64)
+
+    nodes = insert_items(root, items, boxes, maxentries, index)
+    while len(nodes) > 1:
+        # grow the tree from the pieces of the split root
+        root = create_node(calc_bbox_children(nodes), children=nodes,
+                           leaf=False, height=heightf(nodes[0])+1)
+        nodes = [root]
+        if len(childrenf(root)) > maxentries:
+            nodes = split_many(root, maxentries, index)
+    return nodes[0]
+
+
+def insert_items(node, items, boxes, maxentries, index=None):
+    """
+    Insert 'items' (bboxes as 'boxes' array) in the leaves under 'node'
+
+    Return the list of nodes 'node' was split into (or just 'node')
+    """
+    if leaff(node):
+        childrenf(node).extend(items)
+        if index is not None:
+            for item in items:
+                index[idf(item)] = node
+    else:
+        children = childrenf(node)
+        targets = route_items(node, boxes)
+        order = np.argsort(targets, kind='mergesort')
+        bounds = np.searchsorted(targets[order], np.arange(len(children)+1))
+        new_children = []
+        for i in range(len(children)):
+            routed = order[bounds[i]:bounds[i+1]]
+            if len(routed) == 0:
+                new_children.append(children[i])
+                continue
+            new_children.extend(insert_items(thaw_child(node, i, index),
+                                             [items[j] for j in routed],
+                                             boxes[routed], maxentries,
+                                             index))
+        children[:] = new_children
+        reset_boxes(node)
+    adjust_bbox(node)
+    if len(childrenf(node)) <= maxentries:
+        return [node]
+    return split_many(node, maxentries, index)
+
+
+def split_many(node, maxentries, index=None):
+    """
+    Split 'node' at once in nodes of (at most) 'maxentries' children
+
+    Children are shared evenly between the fewest nodes possible (see
+    'split_groups'), each node having then at least half 'maxentries'
+    children.
+    """
+    children = childrenf(node)
+    bboxes = np.array([child.bbox for child in children], dtype=np.float64)
+    num_groups = -(-len(children) // maxentries)
+    nodes = []
+    for group in split_groups(bboxes, np.arange(len(children)), num_groups):
+        group = [children[j] for j in group]
+        nodes.append(create_node(calc_bbox_children(group), children=group,
+                                 leaf=leaff(node), height=heightf(node)))
+        if index is not None and leaff(node):
+            index_leaves(nodes[-1], index)
+    return nodes
+
+
+def split_groups(bboxes, order, num_groups):
+    """
+    Return 'num_groups' arrays of even sizes sharing 'order' indexes of
+    'bboxes', near ones together
+
+    Boxes are sorted by centre along the axis they spread the most on,
+    and cut in two, recursively.
+    """
+    if num_groups == 1:
+        return [order]
+    centres = bboxes[order, :2] + bboxes[order, 2:]
+    axis = np.argmax(np.ptp(centres, axis=0))
+    order = order[np.argsort(centres[:, axis], kind='mergesort')]
+    left = num_groups // 2
+    cut = len(order) * left // num_groups
+    return (split_groups(bboxes, order[:cut], left) +
+            split_groups(bboxes, order[cut:], num_groups - left))
+
+
 # @profile
-def insert_node(root, item, maxentries, minentries, item_height=None):
+def insert_node(root, item, maxentries, minentries, item_height=None,
+                index=None, strategy='rbush', reinserted=None,
+                split_method='rstar'):
     """
     Insert node 'item' accordingly in 'root' node (tree)
+
+    With the 'rstar' strategy, the subtree is chosen by least overlap
+    enlargement next to the leaves, and nodes overflowing for the first
+    time at their height (heights in 'reinserted' set) during an insertion
+    get some children inserted again rather than being split (R*-tree).
     """
+    rstar = strategy == 'rstar'
     if item_height is None:
         level = heightf(root) - 1
     else:
         level = heightf(root) - item_height - 1
     path = list()
-    node = choose_subtree(root, item, level, path)
+    node = choose_subtree(root, item, level, path, overlap=rstar,
+                          index=index)
 
     childrenf(node).append(item)
+    reset_boxes(node)
+    if index is not None and leaff(node):
+        index[idf(item)] = node
     # node = extend(node, item)  # this will be done by 'adjust_bboxes' below
 
     assert get(path, len(path)-1) is node
@@ -71,17 +439,56 @@ def insert_node(root, item, maxentries, minentries, item_height=None):
 
     adjusted_path = adjust_bboxes(item, path)
 
-    if len(childrenf(node)) > maxentries:
-        root = balance_nodes(adjusted_path, maxentries, minentries)
-    else:
-        root = adjusted_path[0]
+    if len(childrenf(node)) <= maxentries:
+        return adjusted_path[0]
+    if rstar and len(path) > 1:
+        if reinserted is None:
+            reinserted = set()
+        if heightf(node) not in reinserted:
+            reinserted.add(heightf(node))
+            return reinsert(adjusted_path, maxentries, minentries, index,
+                            reinserted, split_method)
+    return balance_nodes(adjusted_path, maxentries, minentries, index,
+                         split_method)
+
+
+def reinsert(path, maxentries, minentries, index, reinserted,
+             split_method='rstar'):
+    """
+    Take out of the (overflowing) last node of 'path' its children farthest
+    from its centre, and insert them again (R*-tree forced reinsertion)
+
+    Return the (new) root
+    """
+    node = get(path, len(path)-1)
+    children = childrenf(node)
+    farthest = farthest_children(node, REINSERT)
+    entries = [children[i] for i in farthest]
+    kept = np.ones(len(children), dtype=bool)
+    kept[farthest] = False
+    children[:] = [child for child, keep in zip(children, kept) if keep]
+    for i in range(len(path)-1, -1, -1):
+        reset_boxes(path[i])
+        adjust_bbox(path[i])
+
+    root = get(path, 0)
+    item_height = None if leaff(node) else heightf(node) - 1
+    for entry in entries:
+        root = insert_node(root, entry, maxentries, minentries,
+                           item_height=item_height, index=index,
+                           strategy='rstar', reinserted=reinserted,
+                           split_method=split_method)
     return root
 
 
 # @profile
-def choose_subtree(node, bbox, level, path):
+def choose_subtree(node, bbox, level, path, overlap=False, index=None):
     '''
     Return node closets to 'bbox', fill 'path' with nodes visited
+
+    With 'overlap', leaves are chosen by least overlap enlargement. Frozen
+    nodes visited are copied (see 'thaw'), 'index' pointing to leaves
+    copies.
     '''
     while True:
         path.append(node)
@@ -89,48 +496,35 @@ def choose_subtree(node, bbox, level, path):
         if leaff(node) or len(path)-1 == level:
             break
 
-        min_enlargement = INF
-        min_area = INF
-
-        target_node = None
-        for i in range(len(childrenf(node))):
-            child = get(childrenf(node), i)
-            area = calc_bbox_area(child)
-            enlargement = calc_enlarged_area(bbox, child) - area
-
-            # choose entry with the least area enlargement
-            if enlargement < min_enlargement:
-                min_enlargement = enlargement
-                if area < min_area:
-                    min_area = area
-                target_node = child
-            else:
-                if enlargement == min_enlargement:
-                    # otherwise choose one with the smallest area
-                    if area < min_area:
-                        min_area = area
-                        target_node = child
-
-        node = target_node or get(childrenf(node), 0)
+        # its cached box is enlarged here, the child itself by adjust_bboxes
+        if overlap and heightf(node) == 2:
+            i = choose_child_overlap(node, bbox)
+        else:
+            i = choose_child(node, bbox)
+        node = thaw_child(node, i, index)
 
     return node
 
 
 # @profile
-def balance_nodes(path, maxentries, minentries):
+def balance_nodes(path, maxentries, minentries, index=None,
+                  split_method='rstar'):
     root = get(path, 0)
     for level in range(len(path)-1, -1, -1):
         node = get(path, level)
         if len(childrenf(node)) <= maxentries:
             break
-        new_node1, new_node2 = split(node, minentries)
+        new_node1, new_node2 = split(node, minentries, split_method)
         assert heightf(node) == heightf(new_node1)
         assert heightf(node) == heightf(new_node2)
+        if index is not None and leaff(new_node2):
+            index_leaves(new_node2, index)
         if level > 0:
             parent = get(path, level-1)
             childrenf(parent).remove(node)
             childrenf(parent).append(new_node1)
             childrenf(parent).append(new_node2)
+            reset_boxes(parent)
             # NOTE: 'parent' has had your borders extended when we 'insert'
         else:
             children = list()
@@ -160,22 +554,121 @@ def search_node(node, bbox):
     if contains(bbox, node):
         items.extend(retrieve_all_items(node))
         return items
-    if childrenf(node) is None:
-        items.append(node)
-    else:
-        n_items = len(childrenf(node))
-        for i in range(n_items):
-            child = get(childrenf(node), i)
+    n_items = len(childrenf(node))
+    for i in range(n_items):
+        child = get(childrenf(node), i)
+        if leaff(node):
+            if intersects(bbox, child):
+                items.append(child)
+        else:
             items.extend(search_node(child, bbox))
     return items
 
 
+def count(node, xmin, ymin, xmax, ymax, dead=None):
+    """
+    Return the number of items under 'node' intersecting the bbox, items
+    flagged (by id) in 'dead' boolean array (if given) left out
+    """
+    bbox = create_bbox(xmin, ymin, xmax, ymax)
+    return count_node(node, bbox, dead)
+
+
+def count_node(node, bbox, dead=None):
+    if not intersects(bbox, node):
+        return 0
+    if contains(bbox, node):
+        return count_items(node, dead)
+    num_items = 0
+    for i in range(len(childrenf(node))):
+        child = get(childrenf(node), i)
+        if leaff(node):
+            num_items += intersects(bbox, child) and not is_dead(child, dead)
+        else:
+            num_items += count_node(child, bbox, dead)
+    return num_items
+
+
+def count_items(node, dead=None):
+    if leaff(node):
+        if dead is None:
+            return len(childrenf(node))
+        return sum(not is_dead(item, dead) for item in childrenf(node))
+    num_items = 0
+    for i in range(len(childrenf(node))):
+        num_items += count_items(get(childrenf(node), i), dead)
+    return num_items
+
+
+def collides(node, xmin, ymin, xmax, ymax, dead=None):
+    """
+    Return True if any item under 'node' intersects the bbox, items flagged
+    (by id) in 'dead' boolean array (if given) left out
+    """
+    bbox = create_bbox(xmin, ymin, xmax, ymax)
+    return collides_node(node, bbox, dead)
+
+
+def collides_node(node, bbox, dead=None):
+    if not intersects(bbox, node):
+        return False
+    for i in range(len(childrenf(node))):
+        child = get(childrenf(node), i)
+        if leaff(node):
+            if intersects(bbox, child) and not is_dead(child, dead):
+                return True
+        elif collides_node(child, bbox, dead):
+            return True
+    return False
+
+
+def knn(root, x, y, k, max_distance=None, dead=None):
+    """
+    Return the 'k' items nearest to 'x,y' as (distance, item), nearest first
+
+    Nodes are visited best-first, by their distance to 'x,y'.  Items
+    flagged (by id) in 'dead' boolean array, if given, are left out.
+    """
+    if max_distance is None:
+        max_distance = INF
+    items = list()
+    if not len(childrenf(root)):
+        # an empty root keeps its INF bbox, squaring it overflows
+        return items
+    # (distance, counter, node or item, is item); 'counter' breaks ties
+    queue = [(calc_point_dist(root, x, y), 0, root, False)]
+    counter = 1
+    while len(queue) and len(items) < k:
+        dist, _, entry, is_item = heapq.heappop(queue)
+        if dist > max_distance:
+            break
+        if is_item:
+            items.append((dist, entry))
+            continue
+        for i in range(len(childrenf(entry))):
+            child = get(childrenf(entry), i)
+            if leaff(entry) and is_dead(child, dead):
+                continue
+            child_dist = calc_point_dist(child, x, y)
+            if child_dist <= max_distance:
+                heapq.heappush(queue, (child_dist, counter, child,
+                                       leaff(entry)))
+                counter += 1
+    return items
+
+
+def is_dead(item, dead):
+    """
+    Return True if 'item' is flagged (by id) in 'dead' array (or None)
+    """
+    if dead is None or idf(item) is None:
+        return False
+    return 0 <= idf(item) < len(dead) and dead[idf(item)]
+
+
 # @profile
 def retrieve_all_items(node):
     items = list()
-    if childrenf(node) is None:
-        items.append(node)
-        return items
     n_items = len(childrenf(node))
     for i in range(n_items):
         item = get(childrenf(node), i)
@@ -187,12 +680,19 @@ def retrieve_all_items(node):
 
 
 # @profile
-def load(root, data, maxentries, minentries):
+def load(root, data, maxentries, minentries, items_data=None, ids=None,
+         method='omt', workers=1, index=None, strategy='rbush',
+         split_method='rstar'):
     """
     Bulk insertion of items from 'data'
 
     'data' is expected to be a numerical array of (N,4) dimensions,
-    or an array of named objects with columns 'xmin,ymin,xmax,ymax'
+    or an array of named objects with columns 'xmin,ymin,xmax,ymax'.
+    'items_data' and 'ids', if given, are arrays with the N items data/ids.
+    'method' and 'workers' are the bulk load algorithm and number of
+    threads used to build the new nodes (see 'rbush.packed.pack').
+    'index', if given, is the id->leaf dict to update (see 'index_leaves').
+    'strategy' and 'split_method' are those of 'insert'.
     """
     # If data is empty or None, do nothing
     if data is None or len(data) == 0:
@@ -205,13 +705,30 @@ def load(root, data, maxentries, minentries):
         else:
             xmin, ymin, xmax, ymax = data.T
             data = [None]*len(xmin)
+        if items_data is not None:
+            data = items_data
         return insert(root, xmin, ymin, xmax, ymax, data,
-                      maxentries=maxentries, minentries=minentries)
+                      maxentries=maxentries, minentries=minentries, ids=ids,
+                      index=index, strategy=strategy,
+                      split_method=split_method)
+
+    # build the tree with the given data from scratch
+    node = unpack(pack(data, maxentries, items_data, ids,
+                       method=method, workers=workers))
+    if index is not None:
+        index_leaves(node, index)
+
+    return merge(root, node, maxentries, minentries, strategy, split_method)
 
-    # recursively build the tree with the given data
-    # from scratch using OMT algorithm
-    node = build_tree(data, 0, len(data)-1, maxentries, minentries)
 
+def merge(root, node, maxentries, minentries, strategy='rbush',
+          split_method='rstar'):
+    """
+    Add the subtree 'node' to the tree 'root', at its level (see
+    'insert_node')
+
+    Return the (new) root
+    """
     if not len(childrenf(root)):
         # save as is if tree is empty
         root = node
@@ -229,78 +746,7 @@ def load(root, data, maxentries, minentries):
             root = node
             node = tmpNode
         # insert the small tree into the large tree at appropriate level
-        level = heightf(root) - heightf(node) - 1
-        root = insert_node(root, node, level, True)
+        root = insert_node(root, node, maxentries, minentries,
+                           item_height=heightf(node), strategy=strategy,
+                           split_method=split_method)
     return root
-
-
-def create_item(bbox, data=None):
-    return (bbox, data)
-
-
-# @profile
-def build_tree(data, first, last, maxentries, minentries, height=None):
-    """
-    Build RBush from 'data' items between 'first','last' (inclusive)
-    """
-    N = last - first + 1
-    M = maxentries
-
-    if N <= M:
-        children = list()
-        for i in range(first, last+1):
-            children.append(create_item(data[i]))
-            # _node = create_node(data[i][0], data[i][1], data[i][2], data[i][3])
-            # children.append(_node)
-        bbox = calc_bbox_children(children)
-        node = create_node(bbox, children=children, leaf=True, height=1)
-        return node
-
-    if height is None:
-        # target height of the bulk-loaded tree
-        height = math.ceil(math.log(N) / math.log(M))
-
-        # target number of root entries to maximize storage utilization
-        M = math.ceil(N / math.pow(M, height - 1))
-
-    # split the data into M mostly square tiles
-    N2 = math.ceil(N / M)
-    N1 = N2 * math.ceil(math.sqrt(M))
-
-    multiselect(data, first, last, N1, 0)
-
-    children = list()
-    for i in range(first, last+1, N1):
-        last2 = min(i + N1 - 1, last)
-        multiselect(data, i, last2, N2, 1)
-        for j in range(i, last2+1, N2):
-            last3 = min(j + N2 - 1, last2)
-            # pack each entry recursively
-            children.append(build_tree(data, first=j, last=last3,
-                                       height=height - 1,
-                                       maxentries=maxentries,
-                                       minentries=minentries))
-    bbox = calc_bbox_children(children)
-    node = create_node(bbox, leaf=False, height=height, children=children)
-    return node
-
-
-# @profile
-def multiselect(data, first, last, n, column):
-    stack = [first, last]
-    mid = None
-    while len(stack):
-        first = stack.pop(0)
-        last = stack.pop(0)
-        if (last - first) <= n:
-            continue
-        mid = first + math.ceil((last - first) / n / 2) * n
-        quicksort(data, first, last, column)
-        stack.extend([first, mid, mid, last])
-
-
-# @profile
-def quicksort(data, first, last, column):
-    idx = np.argsort(data[first:last, column], kind='quicksort')
-    idx += first
-    data[first:last,:] = data[idx,:]
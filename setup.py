@@ -8,5 +8,6 @@ setup(name='py-rbush',
       description='Python port of JS rbush library',
       url='http://github.com/parietal-io/py-rbush',
       packages=find_packages(),
+      python_requires='>=3.6',
       zip_safe=False,
       include_package_data=True)